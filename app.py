@@ -1,18 +1,56 @@
+import uuid
+
 import streamlit as st
 import pandas as pd
-from src.crew import (
-    researcher, writer, strategist, coach, persona, pdm, architect,
-    research_task, analysis_task, strategy_task, coach_task, persona_task, requirements_task, design_task
-)
-from src.utils import (
-    load_history_data, save_history_data, clean_topic_name, 
-    extract_json_from_text, split_report_by_agent
-)
-from crewai import Crew, Process
+# crewai などの重いモジュールはここでは読み込まない（ジョブの実行時・warm_up() で読み込みます）
+from src.competitors import get_competitor_index
+from src.jobs import get_job_queue, warm_up
+from src.metrics import get_recorder
+from src.prefetch import PREFETCH_ENABLED, build_prefetch_queries, get_prefetcher
+from src.similarity import SIMILARITY_THRESHOLD, find_similar_topics
+from src.templates import PAGE_FETCH_ENABLED, select_task_names
+from src.utils import load_history_data, clean_topic_name, split_report_by_agent, build_topic, validate_competitor_rows
 
 # --- ページ設定 ---
 st.set_page_config(page_title="AI 競合調査エージェント", layout="wide")
 
+
+@st.cache_resource
+def start_warm_up():
+    """プロセスごとに1回だけ、クルーの実行に必要なモジュールを裏で読み込み始める"""
+    warm_up()
+
+
+@st.cache_data(max_entries=32)
+def split_sections(report_text):
+    """レポートのエージェントごとの分割結果を、再実行のたびに作り直さないようにする"""
+    return split_report_by_agent(report_text)
+
+
+@st.cache_data(max_entries=32)
+def to_csv_bytes(df):
+    return df.to_csv(index=False).encode('utf-8')
+
+
+@st.cache_data(max_entries=32)
+def load_competitor_index(version, search, min_appearances):
+    """競合インデックスの集計結果（version は索引が更新されたら変わる値）"""
+    rows = get_competitor_index().top_competitors(search, min_appearances=min_appearances, limit=200)
+    return pd.DataFrame(rows, columns=["key", "name", "url", "appearances", "functionality", "usability", "last_seen"])
+
+
+@st.cache_data(max_entries=4)
+def competitor_index_parquet(version):
+    import io
+    import pyarrow.parquet as pq
+
+    buffer = io.BytesIO()
+    pq.write_table(get_competitor_index().to_arrow(), buffer)
+    return buffer.getvalue()
+
+
+start_warm_up()
+
 st.title("🤖 AI 起業アイデア壁打ちエージェント")
 st.markdown("あなたの起業アイデアを入力してください。AIチームが市場調査から戦略立案まで行います。")
 
@@ -39,15 +77,7 @@ with col2:
     context_info = st.text_area("現状", placeholder="例：エンジニア1名で開発。予算はほぼゼロなので広告は打てない。", height=100, label_visibility="collapsed")
 
 # 入力情報を結合して「トピック」を作る
-if product_name:
-    topic = f"""
-    【プロダクト名】{product_name}
-    【ターゲット】{target_audience}
-    【特徴・強み】{main_features}
-    【開発者の現状】{context_info}
-    """
-else:
-    topic = ""
+topic = build_topic(product_name, target_audience, main_features, context_info)
 
 # --- 設定エリア ---
 st.markdown("---")
@@ -65,10 +95,48 @@ with opt_col1:
 with opt_col2:
     st.markdown("**検索設定**")
     search_limit = st.slider("検索上限数", 1, 10, 5, help="AIが参考にするWebサイトの数です。多いほど時間はかかりますが情報量が増えます。")
+    fetch_pages = st.checkbox("検索結果のページ本文も読む", value=PAGE_FETCH_ENABLED, help="各サイトの本文の要点をAIに渡します。検索上限数のページを同時に読み込みます。")
     force_fetch = st.checkbox("強制的にWeb検索を行う", value=False, help="チェックを入れると、過去の履歴を使わずに最新の情報を取得し直します。")
+    prefetch = st.checkbox("入力中に検索を先読みする", value=PREFETCH_ENABLED, help="プロダクト名を入力した時点で、履歴の確認とWeb検索を裏で始めておきます。調査開始後の待ち時間が短くなります。")
+    similarity_threshold = st.slider(
+        "類似アイデアの判定しきい値", 0.5, 1.0, SIMILARITY_THRESHOLD, 0.01,
+        help="過去に調査したアイデアとの類似度がこの値以上なら、結果の再利用を提案します。1.0にすると提案しません。"
+    )
 
 st.markdown("") # 余白
 
+# --- 入力中の先読み（プロダクト名が決まったら、履歴の確認と検索を裏で始めておく） ---
+session_id = st.session_state.setdefault('session_id', uuid.uuid4().hex)
+prefetch_queries = build_prefetch_queries(product_name, target_audience)
+if prefetch and not force_fetch and prefetch_queries:
+    get_prefetcher().schedule(session_id, topic, prefetch_queries, max_results=search_limit, fetch_pages=fetch_pages)
+else:
+    get_prefetcher().cancel(session_id)
+
+
+def start_job(topic, task_names, use_cache, seed_competitors=None, prefetched_results=None):
+    """バックグラウンドのジョブとして実行する（画面は下の進捗エリアで定期的に更新）"""
+    job_id = get_job_queue().submit(
+        topic, task_names, use_cache=use_cache, seed_competitors=seed_competitors,
+        search_options={"max_results": search_limit, "fetch_pages": fetch_pages},
+        prefetched_results=prefetched_results
+    )
+    st.session_state['job_id'] = job_id
+    # ページを再読み込みしても続きを表示できるよう、URLにもジョブIDを残す
+    st.query_params['job'] = job_id
+
+
+def show_cached_result(cached_data):
+    """履歴の結果をそのまま表示用に読み込む"""
+    st.session_state['report'] = cached_data['report']
+    # 以前の形式で保存された履歴も、採点を数値にそろえてから表示する
+    df_data = validate_competitor_rows(cached_data['df_data'])
+    if df_data:
+        st.session_state['df'] = pd.DataFrame(df_data)
+    else:
+        st.session_state['df'] = None
+
+
 # --- 実行ボタン ---
 if st.button("🚀 調査を開始する", type="primary"):
     if not product_name:
@@ -78,108 +146,147 @@ if st.button("🚀 調査を開始する", type="primary"):
         safe_topic_name = clean_topic_name(product_name)
         st.session_state['topic'] = safe_topic_name
         
+        # 先読みが終わっていれば、その履歴・類似検索・検索結果を使う（検索が間に合わなければ待たずに始める）
+        prefetched = None
+        if prefetch and not force_fetch:
+            with st.spinner("先読みした検索結果を確認しています..."):
+                prefetched = get_prefetcher().take(
+                    session_id, topic, prefetch_queries, max_results=search_limit, fetch_pages=fetch_pages
+                )
+        prefetched_results = prefetched['results'] if prefetched else None
+
         # 1. 履歴の確認
-        history = load_history_data()
+        if force_fetch:
+            cached_data = None
+        elif prefetched and prefetched['history']:
+            cached_data = prefetched['history']
+        else:
+            cached_data = load_history_data(topic)
         
-        if topic in history and not force_fetch:
+        # 途中で止まった実行の結果（complete=False）はキャッシュとして使わない
+        if cached_data and cached_data['complete']:
             st.info(f"📜 「{product_name}」の過去の調査履歴が見つかりました。APIを使わずに表示します。")
-            cached_data = history[topic]
-            st.session_state['report'] = cached_data['report']
-            
-            if cached_data['df_data']:
-                st.session_state['df'] = pd.DataFrame(cached_data['df_data'])
-            else:
-                st.session_state['df'] = None
+            show_cached_result(cached_data)
         
         # 2. AI実行
         else:
             st.session_state['df'] = None
             st.session_state['report'] = None
 
-            with st.status("🚀 AIエージェントチームが調査中...") as status:
-                # チーム編成
-                my_agents = [researcher, writer]
-                my_tasks = [research_task, analysis_task]
-                
-                if use_strategy:
-                    my_agents.append(strategist)
-                    my_tasks.append(strategy_task)
-                    st.write("🕵️ 戦略コンサルタントが参加しました")
-                
-                if use_coach:
-                    my_agents.append(coach)
-                    my_tasks.append(coach_task)
-                    st.write("🏃‍♂️ スタートアップ・コーチが参加しました")
-
-                if use_persona:
-                    my_agents.append(persona)
-                    my_tasks.append(persona_task)
-                    st.write("🗣️ 辛口ユーザーが参加しました")
-
-                if use_design:
-                    my_agents.append(pdm)
-                    my_tasks.append(requirements_task)
-                    my_agents.append(architect)
-                    my_tasks.append(design_task)
-                    st.write("💻 開発チーム（PdM・テックリード）が参加しました")
-
-                # タスク記述の更新
-                research_task.description = f"以下のプロダクト案について市場調査を行い、競合サービスをリストアップしてください。\n\n{topic}\n\n検索結果が英語であっても、報告は必ず日本語で行ってください。"
-                analysis_task.description = """
-                レポートを作成してください。
-                最後に、調査した競合サービス（3〜5つ）と、ユーザーのアイデア（自分のプロダクト）を比較するためのJSONデータを出力してください。
-                各サービスを以下の2軸で1〜10点で採点してください：
-                - functionality: 機能の豊富さ（1:単機能 〜 10:多機能・オールインワン）
-                - usability: 手軽さ・初心者への優しさ（1:難しい・専門的 〜 10:簡単・直感的）
-                
-                JSON形式:
-                [
-                    {"name": "競合A", "url": "...", "features": "...", "functionality": 7, "usability": 8, "type": "competitor"},
-                    {"name": "自分のプロダクト", "url": "-", "features": "...", "functionality": 5, "usability": 9, "type": "self"}
-                ]
-                必ずこのJSONブロックのみを最後に出力してください。
-                """
-
-                # 実行
-                crew = Crew(
-                    agents=my_agents,
-                    tasks=my_tasks,
-                    process=Process.sequential
-                )
-                
-                result = crew.kickoff(inputs={'topic': topic})
-                
-                # 結果の結合
-                full_report = ""
-                for task_output in result.tasks_output:
-                    agent_role = getattr(task_output, 'agent', '担当エージェント')
-                    full_report += f"## 👤 {agent_role} の報告\n\n"
-                    full_report += str(task_output) + "\n\n---\n\n"
-                
-                st.session_state['report'] = full_report
-                
-                # JSONデータの抽出（utils関数を使用）
-                df_data = None
-                
-                # analysis_taskの結果からJSONを探す（もしanalysis_taskがあれば）
-                # ※タスクリストの順番が変わっても大丈夫なように、output.raw全体から探す簡易的な方法をとります
-                extracted_data = extract_json_from_text(full_report)
-                
-                if extracted_data:
-                    # ★修正: データが「リスト」じゃなかったら、リストに入れてあげる（重要！）
-                    if isinstance(extracted_data, list):
-                         df_data = extracted_data
-                    else:
-                         df_data = [extracted_data]
-                    
-                    st.session_state['df'] = pd.DataFrame(df_data)
-                    status.update(label="✅ 全工程完了！レポートができました", state="complete")
-                else:
-                    st.session_state['df'] = None
-                    status.update(label="⚠️ 分析完了（比較表データなし）", state="complete")
-
-                # 履歴に保存
-                save_history_data(topic, full_report, df_data)
+            # チーム編成
+            task_names = select_task_names(
+                use_strategy=use_strategy, use_coach=use_coach,
+                use_persona=use_persona, use_design=use_design
+            )
+            
+            if use_strategy:
+                st.write("🕵️ 戦略コンサルタントが参加しました")
+            
+            if use_coach:
+                st.write("🏃‍♂️ スタートアップ・コーチが参加しました")
+
+            if use_persona:
+                st.write("🗣️ 辛口ユーザーが参加しました")
+
+            if use_design:
+                st.write("💻 開発チーム（PdM・テックリード）が参加しました")
+
+            # 入力を少し変えただけのアイデアなら、過去の結果を使うか先に確認する
+            if force_fetch:
+                similar = []
+            elif prefetched:
+                similar = [m for m in prefetched['similar'] if m['similarity'] >= similarity_threshold]
+            else:
+                similar = find_similar_topics(topic, threshold=similarity_threshold, limit=1)
+            st.session_state.pop('similar', None)
+            if similar:
+                st.session_state['similar'] = {
+                    'topic': topic, 'task_names': task_names, 'match': similar[0],
+                    'prefetched_results': prefetched_results,
+                }
+            else:
+                # 強制検索でなければ、同じ入力で実行済みのタスクはキャッシュを再利用する
+                start_job(topic, task_names, use_cache=not force_fetch, prefetched_results=prefetched_results)
+
+
+# --- 似たアイデアの履歴があったときの確認 ---
+if 'similar' in st.session_state:
+    pending = st.session_state['similar']
+    match = pending['match']
+    st.warning(f"🔍 よく似たアイデアの調査履歴が見つかりました（類似度 {match['similarity']:.2f}）。")
+    with st.expander("見つかった過去のアイデア"):
+        st.text(match['topic'])
+        if match['competitors']:
+            st.markdown("\n".join(f"- {c['name']}" for c in match['competitors']))
+
+    reuse_col, seed_col, new_col = st.columns(3)
+    if reuse_col.button("📜 過去の結果をそのまま使う"):
+        cached_data = load_history_data(match['topic'])
+        st.session_state.pop('similar')
+        if cached_data:
+            show_cached_result(cached_data)
+        else:
+            start_job(pending['topic'], pending['task_names'], use_cache=True,
+                      prefetched_results=pending.get('prefetched_results'))
+        st.rerun()
+    if seed_col.button("🔁 競合リストを引き継いで調査", disabled=not match['competitors']):
+        st.session_state.pop('similar')
+        start_job(pending['topic'], pending['task_names'], use_cache=True, seed_competitors=match['competitors'],
+                  prefetched_results=pending.get('prefetched_results'))
+        st.rerun()
+    if new_col.button("🆕 新しく調査する"):
+        st.session_state.pop('similar')
+        start_job(pending['topic'], pending['task_names'], use_cache=True,
+                  prefetched_results=pending.get('prefetched_results'))
+        st.rerun()
+
+
+# --- 実行中ジョブの進捗表示 ---
+if 'job_id' not in st.session_state and 'job' in st.query_params:
+    st.session_state['job_id'] = st.query_params['job']
+
+
+@st.fragment(run_every="2s")
+def show_job_progress(job_id):
+    """ジョブの状態を定期的に確認し、終わったエージェントのタブから結果を表示する"""
+    job = get_job_queue().get(job_id)
+    if job is None:
+        st.session_state.pop('job_id', None)
+        st.query_params.pop('job', None)
+        return
+
+    if job['status'] == 'done':
+        st.session_state['report'] = job['report']
+        st.session_state['df'] = pd.DataFrame(job['df_data']) if job['df_data'] else None
+        st.session_state['run_id'] = job_id
+        st.session_state.pop('job_id', None)
+        st.query_params.pop('job', None)
+        if job['df_data']:
+            st.toast("✅ 全工程完了！レポートができました")
+        else:
+            st.toast("⚠️ 分析完了（比較表データなし）")
+        st.rerun()
+
+    st.markdown("---")
+    if job['status'] == 'failed':
+        st.error(f"❌ 調査が途中で失敗しました: {job['error']}")
+        if st.button("🔁 続きから再開する"):
+            get_job_queue().retry(job_id)
+    else:
+        st.info(f"🚀 AIエージェントチームが調査中...（{len(job['outputs'])}/{len(job['roles'])} 完了）")
+
+    st.subheader("📊 分析レポート（途中経過）")
+    tabs = st.tabs(job['roles'])
+    for i, tab in enumerate(tabs):
+        with tab:
+            if i in job['outputs']:
+                st.markdown(job['outputs'][i])
+            else:
+                st.info("⏳ 担当エージェントが作業中です...")
+
+
+if 'job_id' in st.session_state:
+    show_job_progress(st.session_state['job_id'])
 
 
 # --- 結果表示エリア ---
@@ -192,7 +299,7 @@ if 'report' in st.session_state and st.session_state['report']:
     report_text = st.session_state['report']
     
     # utils関数を使って分割
-    roles, contents = split_report_by_agent(report_text)
+    roles, contents = split_sections(report_text)
     
     if roles:
         tabs = st.tabs(roles)
@@ -233,10 +340,87 @@ if 'df' in st.session_state and st.session_state['df'] is not None:
         )
     
     # CSVダウンロードボタン（元の位置のまま）
-    csv = st.session_state['df'].to_csv(index=False).encode('utf-8')
+    csv = to_csv_bytes(st.session_state['df'])
     st.download_button(
         label="💾 比較データをダウンロード (CSV)",
         data=csv,
         file_name=f"{file_prefix}_competitors.csv",
         mime="text/csv"
     )
+
+# --- 実行プロファイル（どのエージェントに時間・トークンがかかったか） ---
+if 'run_id' in st.session_state:
+    events = get_recorder().run_events(st.session_state['run_id'])
+    if events:
+        with st.expander("⏱️ 実行プロファイル"):
+            profile_df = pd.DataFrame(events)
+            task_df = profile_df[profile_df['name'] == 'task']
+            if not task_df.empty:
+                columns = [c for c in ['agent', 'wall_sec', 'queue_wait_sec', 'cache', 'prompt_tokens',
+                                       'completion_tokens', 'context_tokens', 'context_tokens_saved',
+                                       'retries'] if c in task_df.columns]
+                st.markdown("**エージェントごとの所要時間・トークン数**")
+                st.dataframe(task_df[columns].sort_values('wall_sec', ascending=False))
+
+            run_df = profile_df[profile_df['name'] == 'crew.run']
+            if 'context_tokens_saved' in run_df.columns and not run_df.empty:
+                saved = int(run_df['context_tokens_saved'].fillna(0).sum())
+                st.caption(f"前段の出力を要約して渡したことで、コンテキストを {saved:,} トークン削減しました")
+
+            summary_df = profile_df.groupby('name').agg(
+                count=('name', 'size'), total_sec=('wall_sec', 'sum'), max_sec=('wall_sec', 'max')
+            )
+            if 'cache' in profile_df.columns:
+                summary_df['cache_hits'] = profile_df[profile_df['cache'] == 'hit'].groupby('name').size()
+            st.markdown("**処理ごとの集計**")
+            st.dataframe(summary_df.fillna(0))
+
+            st.download_button(
+                label="📈 メトリクスをダウンロード (Prometheus形式)",
+                data=get_recorder().render_prometheus(),
+                file_name="metrics.prom",
+                mime="text/plain"
+            )
+
+# --- 競合インデックス（これまでの全アイデアで見つかった競合の横断集計） ---
+# 索引が使えない・読めないときは、この欄を出さずに他の表示を続ける
+try:
+    competitor_index = get_competitor_index()
+    index_version = competitor_index.version() if competitor_index else (0, None)
+except Exception as e:
+    print(f"Competitor index unavailable: {e}")
+    index_version = (0, None)
+if index_version[0]:
+    with st.expander("🌐 競合インデックス（全アイデア横断）"):
+        idx_col1, idx_col2 = st.columns([3, 1])
+        with idx_col1:
+            index_search = st.text_input("競合を検索（名前・URL）", key="index_search")
+        with idx_col2:
+            min_appearances = st.number_input("最低出現回数", min_value=1, value=1, step=1)
+        index_df = load_competitor_index(index_version, index_search, int(min_appearances))
+
+        st.dataframe(index_df.drop(columns=["key", "last_seen"]), hide_index=True)
+        if not index_df.empty:
+            st.markdown("**🗺️ 全アイデアのポジショニングマップ（平均スコア・点の大きさは出現回数）**")
+            st.scatter_chart(
+                index_df.dropna(subset=['functionality', 'usability']),
+                x='usability',
+                y='functionality',
+                color='name',
+                size='appearances',
+            )
+
+            selected = st.selectbox("出現したアイデアを見る", index_df['name'].tolist(), index=None)
+            if selected:
+                key = index_df.loc[index_df['name'] == selected, 'key'].iloc[0]
+                st.dataframe(
+                    pd.DataFrame(get_competitor_index().appearances(key)).drop(columns=["seen_at"]),
+                    hide_index=True
+                )
+
+        st.download_button(
+            label="📦 競合インデックスをダウンロード (Parquet)",
+            data=competitor_index_parquet(index_version),
+            file_name="competitor_index.parquet",
+            mime="application/octet-stream"
+        )
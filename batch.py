@@ -0,0 +1,174 @@
+"""
+アイデアのCSV / JSONLをまとめて調査するバッチ実行用のエントリーポイント。
+
+    python batch.py ideas.csv --output batch_output --workers 4
+
+入力ファイルの列（JSONLの場合はキー）:
+    product_name, target_audience, main_features, context_info
+（日本語の列名「プロダクト名」「ターゲット」「特徴・強み」「開発者の現状」も使えます）
+
+履歴・タスク結果・検索結果のキャッシュは app.py と共有します。
+"""
+import argparse
+import csv
+import json
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+from src.utils import build_topic, clean_topic_name, load_history_data
+
+# 日本語の列名も受け付ける
+COLUMN_ALIASES = {
+    "プロダクト名": "product_name",
+    "ターゲット": "target_audience",
+    "特徴・強み": "main_features",
+    "開発者の現状": "context_info",
+}
+
+
+def load_ideas(path):
+    """CSV または JSONL からアイデアの一覧を読み込む"""
+    with open(path, "r", encoding="utf-8-sig") as f:
+        if path.endswith(".jsonl"):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = list(csv.DictReader(f))
+
+    ideas = []
+    for row in rows:
+        idea = {COLUMN_ALIASES.get(key, key): (value or "").strip() for key, value in row.items()}
+        if idea.get("product_name"):
+            ideas.append(idea)
+    return ideas
+
+
+class StartRateLimiter:
+    """アイデアの実行開始を1分あたり一定数までに抑える（スレッド間で共有）"""
+
+    def __init__(self, per_minute):
+        self.interval = 60.0 / per_minute if per_minute else 0
+        self._next_start = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start)
+            self._next_start = start + self.interval
+        time.sleep(max(0.0, start - now))
+
+
+def run_idea(index, idea, task_names, use_cache, output_dir, search_options=None):
+    """
+    アイデア1件を調査して結果をファイルに書き出し、実行結果のサマリーを返す。
+    プロセスプールからも呼べるよう、モジュールのトップレベルに置いています。
+    """
+    from src.runner import run_crew
+
+    topic = build_topic(
+        idea["product_name"], idea.get("target_audience", ""),
+        idea.get("main_features", ""), idea.get("context_info", "")
+    )
+    started = time.perf_counter()
+    summary = {"index": index, "product_name": idea["product_name"]}
+
+    try:
+        cached_data = load_history_data(topic) if use_cache else None
+        if cached_data and cached_data["complete"]:
+            full_report, df_data = cached_data["report"], cached_data["df_data"]
+            summary["cached"] = True
+        else:
+            full_report, df_data = run_crew(topic, task_names, use_cache=use_cache, search_options=search_options)
+            summary["cached"] = False
+    except Exception as e:
+        summary.update(status="failed", error=str(e), latency_sec=time.perf_counter() - started)
+        return summary
+
+    idea_dir = os.path.join(output_dir, f"{index:03d}_{clean_topic_name(idea['product_name'])}")
+    os.makedirs(idea_dir, exist_ok=True)
+    with open(os.path.join(idea_dir, "report.md"), "w", encoding="utf-8") as f:
+        f.write(full_report)
+    if df_data:
+        fieldnames = list(dict.fromkeys(key for row in df_data for key in row))
+        with open(os.path.join(idea_dir, "competitors.csv"), "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames)
+            writer.writeheader()
+            writer.writerows(df_data)
+
+    summary.update(
+        status="done", output_dir=idea_dir, competitors=len(df_data or []),
+        latency_sec=time.perf_counter() - started
+    )
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="アイデアのCSV / JSONLをまとめて調査します")
+    parser.add_argument("input", help="アイデア一覧（.csv または .jsonl）")
+    parser.add_argument("-o", "--output", default="batch_output", help="結果を書き出すディレクトリ")
+    parser.add_argument("-w", "--workers", type=int, default=2, help="同時に調査するアイデア数")
+    parser.add_argument("--processes", action="store_true", help="スレッドではなくプロセスで並列実行する")
+    parser.add_argument("--ideas-per-minute", type=float, default=0, help="1分あたりに開始するアイデア数の上限（0で無制限）")
+    parser.add_argument("--force", action="store_true", help="キャッシュを使わずに調査し直す")
+    parser.add_argument("--no-strategy", action="store_true", help="戦略コンサルを外す")
+    parser.add_argument("--coach", action="store_true", help="起業コーチを加える")
+    parser.add_argument("--persona", action="store_true", help="辛口ユーザーを加える")
+    parser.add_argument("--no-design", action="store_true", help="システム設計を外す")
+    parser.add_argument("--search-limit", type=int, default=5, help="1回の検索で参考にするWebサイトの数")
+    from src.templates import PAGE_FETCH_ENABLED, select_task_names
+    parser.add_argument("--page-fetch", action=argparse.BooleanOptionalAction, default=PAGE_FETCH_ENABLED,
+                        help="検索結果のページ本文も読み込む（デフォルトは環境変数 PAGE_FETCH_ENABLED）")
+    args = parser.parse_args()
+    search_options = {"max_results": args.search_limit, "fetch_pages": args.page_fetch}
+
+    task_names = select_task_names(
+        use_strategy=not args.no_strategy, use_coach=args.coach,
+        use_persona=args.persona, use_design=not args.no_design
+    )
+
+    ideas = load_ideas(args.input)
+    os.makedirs(args.output, exist_ok=True)
+    print(f"{len(ideas)} 件のアイデアを調査します（並列数: {args.workers}）")
+
+    limiter = StartRateLimiter(args.ideas_per_minute)
+    executor_class = ProcessPoolExecutor if args.processes else ThreadPoolExecutor
+    started = time.perf_counter()
+    summaries = []
+
+    with executor_class(max_workers=max(1, args.workers)) as pool:
+        futures = []
+        for index, idea in enumerate(ideas, 1):
+            limiter.wait()
+            futures.append(pool.submit(run_idea, index, idea, task_names, not args.force, args.output, search_options))
+
+        for future in as_completed(futures):
+            summary = future.result()
+            summaries.append(summary)
+            mark = "✅" if summary["status"] == "done" else "❌"
+            print(f"{mark} [{summary['index']}] {summary['product_name']} ({summary['latency_sec']:.1f}秒)")
+
+    elapsed = time.perf_counter() - started
+    summaries.sort(key=lambda s: s["index"])
+    latencies = sorted(s["latency_sec"] for s in summaries)
+    stats = {
+        "ideas": len(summaries),
+        "succeeded": sum(s["status"] == "done" for s in summaries),
+        "elapsed_sec": elapsed,
+        "ideas_per_minute": len(summaries) / elapsed * 60 if elapsed else 0,
+        "latency_p50_sec": latencies[len(latencies) // 2] if latencies else 0,
+        "latency_max_sec": latencies[-1] if latencies else 0,
+        "ideas_detail": summaries,
+    }
+    with open(os.path.join(args.output, "summary.json"), "w", encoding="utf-8") as f:
+        json.dump(stats, f, ensure_ascii=False, indent=4)
+
+    print(f"完了: {stats['succeeded']}/{stats['ideas']} 件, {elapsed:.1f}秒, "
+          f"{stats['ideas_per_minute']:.2f} 件/分, p50 {stats['latency_p50_sec']:.1f}秒")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""
+API・ネットワークを使わないパイプライン全体のベンチマーク。
+
+    python -m benchmarks.bench_pipeline --output bench.json
+    python -m benchmarks.bench_pipeline --baseline bench.json   # 前回の結果と比較
+
+Gemini と DDGS をローカルのスタブ（レイテンシ・出力サイズを指定可能）に差し替えて、
+app.py と同じ経路（runner → scheduler → crew → tools → utils）を実行し、
+以下を計測して JSON にまとめます。
+
+- 全オプションの組み合わせについて、キャッシュなし（cold）/ タスクキャッシュあり（warm）の実行時間
+- 履歴キャッシュのヒット・ミス時の読み込み時間
+- 大きな履歴（件数・レポートサイズを指定）での読み込み・保存時間
+- レイテンシのパーセンタイル、スループット、ピークメモリ
+"""
+import argparse
+import functools
+import itertools
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+import zlib
+
+# 計測結果がローカルのキャッシュやレート制限に影響されないよう、
+# src をインポートする前に保存先を一時ディレクトリへ向け、上限を外しておく
+_WORK_DIR = tempfile.mkdtemp(prefix="bench_")
+for _name, _file in [("HISTORY_DB", "history.db"), ("TASK_CACHE_DB", "task_cache.db"),
+                     ("SEARCH_CACHE_DB", "search_cache.db"), ("JOBS_DB", "jobs.db"),
+                     ("RATE_LIMIT_DB", "ratelimit.db"), ("METRICS_TRACE_FILE", "traces.jsonl"),
+                     ("PAGE_CACHE_DB", "page_cache.db")]:
+    os.environ[_name] = os.path.join(_WORK_DIR, _file)
+os.environ["GEMINI_RPM"] = os.environ["DDGS_RPM"] = "1000000"
+os.environ["GEMINI_TPM"] = "1000000000"
+os.environ["HEDGE_PROVIDERS"] = ""
+# 埋め込みモデルの読み込みやページ取得（ネットワーク）が計測に混ざらないようにする
+os.environ["SIMILARITY_ENABLED"] = "0"
+os.environ["PAGE_FETCH_ENABLED"] = "0"
+
+from crewai import BaseLLM  # noqa: E402
+
+from benchmarks.common import compare, percentiles  # noqa: E402
+import src.crew  # noqa: E402
+import src.tools  # noqa: E402
+from src.history import SQLiteHistoryStore  # noqa: E402
+from src.runner import run_crew  # noqa: E402
+from src.templates import select_task_names  # noqa: E402
+from src.utils import build_topic, load_history_data  # noqa: E402
+
+# 比較表の抽出も通るよう、分析タスクにはJSONブロックを返す
+_STUB_TABLE = json.dumps([
+    {"name": "競合A", "url": "https://a.example.com", "features": "多機能", "functionality": 8, "usability": 5, "type": "competitor"},
+    {"name": "競合B", "url": "https://b.example.com", "features": "シンプル", "functionality": 4, "usability": 9, "type": "competitor"},
+    {"name": "自分のプロダクト", "url": "-", "features": "AIで細分化", "functionality": 6, "usability": 8, "type": "self"},
+], ensure_ascii=False)
+
+
+class StubLLM(BaseLLM):
+    """指定したレイテンシ・文字数で決まった応答を返す Gemini の代わり"""
+
+    def __init__(self, model="stub/gemini", latency=0.5, output_chars=3000):
+        super().__init__(model=model)
+        object.__setattr__(self, "latency", latency)
+        object.__setattr__(self, "output_chars", output_chars)
+
+    def call(self, messages, *args, **kwargs):
+        time.sleep(self.latency)
+        if isinstance(messages, str):
+            prompt = messages
+        else:
+            prompt = "".join(str(m.get("content", "")) for m in messages)
+
+        # 検索ツールを持つエージェントには、まず1回検索させる
+        if "WebSearch" in prompt and "Observation:" not in prompt:
+            return 'Thought: 競合を検索します\nAction: WebSearch\nAction Input: {"query": "タスク管理アプリ 競合"}'
+
+        body = ("ベンチマーク用の応答です。" * (self.output_chars // 12 + 1))[:self.output_chars]
+        if "JSON形式" in prompt:
+            body += f"\n\n```json\n{_STUB_TABLE}\n```"
+        return f"Thought: 回答をまとめます\nFinal Answer: {body}"
+
+    def supports_function_calling(self):
+        return False
+
+    def supports_stop_words(self):
+        return True
+
+    def get_context_window_size(self):
+        return 1_000_000
+
+
+class StubDDGS:
+    """指定したレイテンシ・件数で検索結果を返す DDGS の代わり"""
+
+    latency = 0.3
+    result_count = 5
+
+    def text(self, query, region=None, safesearch=None, timelimit=None, max_results=5):
+        time.sleep(self.latency)
+        return [
+            {"title": f"{query} {i}", "href": f"https://example.com/{zlib.crc32(query.encode()) % 1000}/{i}", "body": "説明文" * 20}
+            for i in range(min(max_results, self.result_count))
+        ]
+
+
+def timed_runs(fn, repeat):
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - started
+    stats = percentiles(latencies)
+    stats["throughput_per_min"] = repeat / elapsed * 60 if elapsed else 0
+    return stats
+
+
+def option_combinations():
+    for use_strategy, use_coach, use_persona, use_design in itertools.product([False, True], repeat=4):
+        name = "+".join(
+            label for label, on in [("strategy", use_strategy), ("coach", use_coach),
+                                    ("persona", use_persona), ("design", use_design)] if on
+        ) or "base"
+        yield name, select_task_names(use_strategy=use_strategy, use_coach=use_coach,
+                                      use_persona=use_persona, use_design=use_design)
+
+
+def bench_crew(repeat):
+    """全オプションの組み合わせを cold（キャッシュなし）と warm（タスクキャッシュあり）で実行する"""
+    results = {}
+    for index, (name, task_names) in enumerate(option_combinations()):
+        counter = itertools.count()
+
+        def cold_run():
+            topic = build_topic(f"ベンチ{index}-{next(counter)}", "フリーランス", "AIでタスク細分化")
+            run_crew(topic, task_names, use_cache=False)
+
+        warm_topic = build_topic(f"ベンチ{index}-warm", "フリーランス", "AIでタスク細分化")
+        run_crew(warm_topic, task_names, use_cache=False)
+
+        results[name] = {
+            "tasks": len(task_names),
+            "cold": timed_runs(cold_run, repeat),
+            "warm": timed_runs(lambda: run_crew(warm_topic, task_names, use_cache=True), repeat),
+        }
+        print(f"crew[{name}] cold p50={results[name]['cold']['p50']:.2f}s warm p50={results[name]['warm']['p50']:.3f}s")
+    return results
+
+
+def bench_history(entries, report_kb, repeat):
+    """大きな履歴を作り、ヒット・ミス時の読み込みと保存の時間を計測する"""
+    # 上限による削除が入ると「ヒット」がミスになるので、件数・サイズ・経過日数の上限は外して計測する
+    store = SQLiteHistoryStore(path=os.path.join(_WORK_DIR, f"history_{entries}.db"), legacy_json=None,
+                               max_entries=0, max_bytes=0, max_age_days=0)
+    report = ("## 👤 競合調査リサーチャー の報告\n\n" + "あ" * 1000 + "\n") * max(1, report_kb // 3)
+    for i in range(entries):
+        store.put(f"topic-{i}", report, [{"name": f"競合{i}", "functionality": 5, "usability": 5}])
+
+    counter = itertools.count()
+    results = {
+        "entries": entries,
+        "report_kb": len(report.encode("utf-8")) // 1024,
+        "hit": timed_runs(lambda: store.get(f"topic-{next(counter) % entries}"), repeat),
+        "miss": timed_runs(lambda: store.get("missing-topic"), repeat),
+        "save": timed_runs(lambda: store.put(f"topic-{next(counter) % entries}", report, None), repeat),
+        "load_all": timed_runs(store.load_all, 3),
+    }
+    print(f"history[{entries}] hit p50={results['hit']['p50'] * 1000:.2f}ms "
+          f"save p50={results['save']['p50'] * 1000:.2f}ms load_all p50={results['load_all']['p50']:.2f}s")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="スタブのLLM・検索でパイプライン全体を計測します")
+    parser.add_argument("--output", default="bench_report.json", help="結果のJSONファイル")
+    parser.add_argument("--baseline", help="比較する前回の結果のJSONファイル")
+    parser.add_argument("--repeat", type=int, default=3, help="各シナリオの繰り返し回数")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="スタブLLMの1回あたりの応答時間（秒）")
+    parser.add_argument("--llm-output-chars", type=int, default=3000, help="スタブLLMの応答の文字数")
+    parser.add_argument("--search-latency", type=float, default=0.3, help="スタブ検索の応答時間（秒）")
+    parser.add_argument("--search-results", type=int, default=5, help="スタブ検索の結果件数")
+    parser.add_argument("--history-entries", type=int, nargs="+", default=[100, 1000], help="合成する履歴の件数")
+    parser.add_argument("--history-report-kb", type=int, default=30, help="合成する履歴1件あたりのレポートサイズ（KB）")
+    args = parser.parse_args()
+
+    # Gemini と DDGS をスタブに差し替える
+    src.crew.LLM = functools.partial(StubLLM, latency=args.llm_latency, output_chars=args.llm_output_chars)
+    StubDDGS.latency = args.search_latency
+    StubDDGS.result_count = args.search_results
+    src.tools.DDGS = StubDDGS
+
+    started = time.perf_counter()
+    report = {
+        "config": vars(args),
+        "crew": bench_crew(args.repeat),
+        "history_lookup": {
+            "hit": timed_runs(lambda: load_history_data(build_topic("ベンチ0-warm", "フリーランス", "AIでタスク細分化")), 20),
+            "miss": timed_runs(lambda: load_history_data("missing-topic"), 20),
+        },
+        "history_large": {str(n): bench_history(n, args.history_report_kb, 20) for n in args.history_entries},
+    }
+    report["total_sec"] = time.perf_counter() - started
+    # Linux では KB 単位、macOS ではバイト単位
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    report["peak_memory_mb"] = peak / 1024 / (1024 if sys.platform == "darwin" else 1)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=4)
+    print(f"結果を {args.output} に保存しました（{report['total_sec']:.1f}秒, ピークメモリ {report['peak_memory_mb']:.0f}MB）")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
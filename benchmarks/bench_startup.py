@@ -0,0 +1,102 @@
+"""
+アプリの起動時間と、画面操作ごとの再実行時間のベンチマーク。
+
+    python -m benchmarks.bench_startup --output bench_startup.json
+    python -m benchmarks.bench_startup --baseline bench_startup.json   # 前回の結果と比較
+
+- 新しいプロセスで app.py が読み込むモジュールと、クルーの実行に必要なモジュール（crewai など）の
+  インポート時間をそれぞれ計測します
+- streamlit の AppTest で app.py を実行し、初回の実行時間と、チェックボックスを操作したときの
+  再実行時間を計測します（レポート表示中の状態で計測します）
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.common import compare, percentiles
+
+# app.py が起動時に読み込むモジュールと、ジョブの実行時に読み込むモジュール
+APP_MODULES = ["streamlit", "pandas", "src.competitors", "src.jobs", "src.metrics", "src.prefetch", "src.similarity",
+               "src.templates", "src.utils"]
+CREW_MODULES = ["src.runner"]
+
+_SAMPLE_REPORT = "".join(
+    f"## 👤 {role} の報告\n\n" + "調査結果の本文です。\n" * 300 + "\n---\n\n"
+    for role in ["競合調査リサーチャー", "ビジネスアナリスト", "戦略コンサルタント"]
+)
+
+
+def import_time(modules, repeat):
+    """新しいプロセスで modules をインポートするのにかかる時間（秒）を計測する"""
+    code = (
+        "import time, importlib; t = time.perf_counter()\n"
+        f"for m in {modules!r}: importlib.import_module(m)\n"
+        "print(time.perf_counter() - t)"
+    )
+    samples = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+        samples.append(float(output.stdout.strip().splitlines()[-1]))
+    return percentiles(samples)
+
+
+def rerun_time(repeat):
+    """AppTest で app.py の初回実行と、チェックボックス操作時の再実行の時間を計測する"""
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file("app.py", default_timeout=120)
+    app.session_state["report"] = _SAMPLE_REPORT
+    started = time.perf_counter()
+    app.run()
+    first_run = time.perf_counter() - started
+
+    samples = []
+    for i in range(repeat):
+        # 「起業コーチ」のチェックを付けたり外したりする
+        app.checkbox[1].set_value(i % 2 == 0)
+        started = time.perf_counter()
+        app.run()
+        samples.append(time.perf_counter() - started)
+    return {"first_run_sec": first_run, "rerun": percentiles(samples)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="アプリの起動時間と再実行時間を計測します")
+    parser.add_argument("--output", default="bench_startup.json", help="結果のJSONファイル")
+    parser.add_argument("--baseline", help="比較する前回の結果のJSONファイル")
+    parser.add_argument("--repeat", type=int, default=5, help="各計測の繰り返し回数")
+    args = parser.parse_args()
+
+    # AppTest でのジョブ・履歴・索引・キャッシュの保存先と、裏での読み込みの有無をそろえる
+    work_dir = tempfile.mkdtemp(prefix="bench_startup_")
+    for name, file in [("HISTORY_DB", "history.db"), ("JOBS_DB", "jobs.db"),
+                       ("METRICS_TRACE_FILE", "traces.jsonl"), ("COMPETITOR_INDEX_DB", "competitors.db"),
+                       ("TASK_CACHE_DB", "task_cache.db"), ("SIMILARITY_DB_DIR", "similarity_index"),
+                       ("SEARCH_CACHE_DB", "search_cache.db"), ("PAGE_CACHE_DB", "page_cache.db")]:
+        os.environ[name] = os.path.join(work_dir, file)
+    os.environ["CREW_PREWARM"] = "0"
+
+    report = {
+        "import": {
+            "app": import_time(APP_MODULES, args.repeat),
+            "crew": import_time(CREW_MODULES, args.repeat),
+        },
+        "app": rerun_time(args.repeat * 4),
+    }
+    print(f"import app p50={report['import']['app']['p50']:.2f}s crew p50={report['import']['crew']['p50']:.2f}s")
+    print(f"app first run={report['app']['first_run_sec']:.2f}s rerun p50={report['app']['rerun']['p50'] * 1000:.0f}ms")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=4)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
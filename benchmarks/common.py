@@ -0,0 +1,33 @@
+"""ベンチマークで共通に使う集計・比較の関数"""
+
+
+def percentiles(values):
+    values = sorted(values)
+    if not values:
+        return {}
+
+    def pick(pct):
+        return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values),
+        "p50": pick(50),
+        "p90": pick(90),
+        "p99": pick(99),
+        "max": values[-1],
+    }
+
+
+def compare(report, baseline):
+    """p50 を前回の結果と比べて表示する"""
+    def walk(current, base, path=""):
+        for key, value in current.items():
+            if isinstance(value, dict) and isinstance(base.get(key), dict):
+                if "p50" in value and "p50" in base[key] and base[key]["p50"]:
+                    ratio = value["p50"] / base[key]["p50"]
+                    print(f"{path}{key}: p50 {base[key]['p50']:.4f}s -> {value['p50']:.4f}s ({ratio:.2f}x)")
+                else:
+                    walk(value, base[key], f"{path}{key}.")
+
+    walk(report, baseline)
@@ -0,0 +1,264 @@
+import os
+import re
+import threading
+import time
+import unicodedata
+from urllib.parse import urlsplit
+
+from src.db import ThreadLocalSQLite
+from src.history import get_history_store, normalize_topic
+
+COMPETITOR_INDEX_DB = os.getenv("COMPETITOR_INDEX_DB", "competitors.db")
+
+# URLのパスまで見ないと別のサービスを区別できないホスト（アプリストアなど）
+_PATH_HOSTS = {
+    "apps.apple.com", "play.google.com", "github.com", "chromewebstore.google.com", "chrome.google.com",
+}
+
+
+def canonical_key(row):
+    """
+    競合を同一視するためのキーを作る。
+    URLがあればホスト名（www. を除く。アプリストアなどはパスも含める）、
+    無ければ表記ゆれをそろえたサービス名を使います。
+    """
+    url = str(row.get("url") or "").strip()
+    parts = urlsplit(url if "//" in url else f"//{url}") if url and url != "-" else None
+    host = (parts.hostname or "") if parts else ""
+    if "." in host:
+        host = host.removeprefix("www.")
+        if host in _PATH_HOSTS:
+            path = parts.path.rstrip("/").lower()
+            return f"url:{host}{path}"
+        return f"url:{host}"
+    name = unicodedata.normalize("NFKC", str(row.get("name") or "")).lower()
+    return "name:" + re.sub(r"[\s\W_]+", "", name)
+
+
+class CompetitorIndex:
+    """
+    全アイデアの比較表に出てきた競合を横断して集計する索引。
+    履歴の保存（save_history_data）のたびに、そのトピックの行だけを差し替えて更新します。
+    """
+
+    def __init__(self, path=COMPETITOR_INDEX_DB):
+        self._db = ThreadLocalSQLite(path)
+        conn = self._db.connect()
+        with conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS competitors (
+                    key TEXT PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    url TEXT NOT NULL,
+                    appearances INTEGER NOT NULL,
+                    first_seen REAL NOT NULL,
+                    last_seen REAL NOT NULL
+                )
+                """
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS appearances (
+                    key TEXT NOT NULL,
+                    topic TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    features TEXT,
+                    functionality REAL,
+                    usability REAL,
+                    seen_at REAL NOT NULL,
+                    PRIMARY KEY (key, topic)
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS appearances_topic ON appearances (topic)")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._backfill()
+
+    def _backfill(self):
+        """初回だけ、既存の履歴（完了したもの）から索引を作る"""
+        conn = self._db.connect()
+        if conn.execute("SELECT value FROM meta WHERE key = 'history_imported'").fetchone():
+            return
+        for topic, entry in get_history_store().load_all().items():
+            if entry.get("complete", True) and entry.get("df_data"):
+                self.record(topic, entry["df_data"])
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('history_imported', ?)", (str(time.time()),)
+            )
+
+    def record(self, topic, df_data):
+        """1トピック分の比較表で索引を更新する（同じトピックの以前の行は置き換えます）"""
+        # src.utils はこのモジュールを読み込むので、循環しないよう呼び出し時にインポートする
+        from src.utils import validate_competitor_rows
+
+        topic = normalize_topic(topic)
+        now = time.time()
+        rows = {}
+        # 以前の形式の履歴（features がリスト、採点が文字列など）も型をそろえてから記録する
+        for row in validate_competitor_rows(df_data) or []:
+            if row["type"] != "self":
+                rows.setdefault(canonical_key(row), row)
+
+        conn = self._db.connect()
+        with conn:
+            old_keys = {key for (key,) in conn.execute("SELECT key FROM appearances WHERE topic = ?", (topic,))}
+            conn.execute("DELETE FROM appearances WHERE topic = ?", (topic,))
+            conn.executemany(
+                """
+                INSERT INTO appearances (key, topic, name, features, functionality, usability, seen_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                [
+                    (key, topic, row["name"], row["features"], row["functionality"], row["usability"], now)
+                    for key, row in rows.items()
+                ]
+            )
+            conn.executemany(
+                """
+                INSERT INTO competitors (key, name, url, appearances, first_seen, last_seen) VALUES (?, ?, ?, 0, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET name = excluded.name, url = excluded.url, last_seen = excluded.last_seen
+                """,
+                [(key, row["name"], row["url"], now, now) for key, row in rows.items()]
+            )
+            # 出現回数は、今回増えた・減った競合の分だけ数え直す
+            conn.executemany(
+                "UPDATE competitors SET appearances = (SELECT COUNT(*) FROM appearances a WHERE a.key = ?) WHERE key = ?",
+                [(key, key) for key in old_keys | set(rows)]
+            )
+            conn.execute("DELETE FROM competitors WHERE appearances = 0")
+
+    def forget(self, topics):
+        """削除された履歴のトピックの出現データを取り除く（出現回数も数え直します）"""
+        for topic in topics:
+            self.record(topic, [])
+
+    def top_competitors(self, search="", min_appearances=1, limit=100):
+        """
+        出現回数の多い順に競合を返す（search で名前・URLを部分一致検索）。
+        各行には平均の functionality / usability も入ります。
+        """
+        pattern = f"%{search.strip()}%"
+        rows = self._db.connect().execute(
+            """
+            SELECT c.key, c.name, c.url, c.appearances, AVG(a.functionality), AVG(a.usability), c.last_seen
+            FROM competitors c JOIN appearances a ON a.key = c.key
+            WHERE c.appearances >= ? AND (c.name LIKE ? OR c.url LIKE ?)
+            GROUP BY c.key
+            ORDER BY c.appearances DESC, c.last_seen DESC
+            LIMIT ?
+            """,
+            (min_appearances, pattern, pattern, limit)
+        ).fetchall()
+        columns = ("key", "name", "url", "appearances", "functionality", "usability", "last_seen")
+        return [dict(zip(columns, row)) for row in rows]
+
+    def appearances(self, key):
+        """指定した競合が出てきたトピックと、そのときの採点を新しい順に返す"""
+        rows = self._db.connect().execute(
+            """
+            SELECT topic, name, features, functionality, usability, seen_at
+            FROM appearances WHERE key = ? ORDER BY seen_at DESC
+            """,
+            (key,)
+        ).fetchall()
+        columns = ("topic", "name", "features", "functionality", "usability", "seen_at")
+        return [dict(zip(columns, row)) for row in rows]
+
+    def version(self):
+        """索引が更新されたかどうかの判定用の値（件数と最終更新日時）"""
+        return tuple(self._db.connect().execute("SELECT COUNT(*), MAX(seen_at) FROM appearances").fetchone())
+
+    def to_arrow(self):
+        """全出現データ（競合ごとのキー・URL付き）を pyarrow の Table で返す"""
+        import pyarrow as pa
+
+        rows = self._db.connect().execute(
+            """
+            SELECT a.key, c.name, c.url, c.appearances, a.topic, a.name, a.features,
+                   a.functionality, a.usability, a.seen_at
+            FROM appearances a JOIN competitors c ON c.key = a.key
+            ORDER BY a.key, a.seen_at
+            """
+        ).fetchall()
+        columns = ("key", "name", "url", "appearances", "topic", "name_in_topic", "features",
+                   "functionality", "usability", "seen_at")
+        types = (pa.string(), pa.string(), pa.string(), pa.int64(), pa.string(), pa.string(), pa.string(),
+                 pa.float64(), pa.float64(), pa.float64())
+        return pa.table(
+            {column: pa.array([row[i] for row in rows], type=types[i]) for i, column in enumerate(columns)}
+        )
+
+    def export_parquet(self, path):
+        """全出現データを Parquet ファイルに書き出し、行数を返す"""
+        import pyarrow.parquet as pq
+
+        table = self.to_arrow()
+        pq.write_table(table, path)
+        return table.num_rows
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_competitor_index():
+    """プロセス内で共有する競合インデックスを返す（作成できない場合は None）"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                try:
+                    _index = CompetitorIndex()
+                except Exception as e:
+                    print(f"Competitor index unavailable: {e}")
+                    return None
+    return _index
+
+
+def index_competitors(topic, df_data):
+    """完了した調査結果の競合を索引に追加する。失敗しても履歴の保存は止めない"""
+    index = get_competitor_index()
+    if index is None:
+        return
+    try:
+        index.record(topic, df_data)
+    except Exception as e:
+        print(f"Competitor index update failed: {e}")
+
+
+def forget_competitors(topics):
+    """削除された履歴のトピックを索引から取り除く。失敗しても履歴の削除は止めない"""
+    if not topics:
+        return
+    index = get_competitor_index()
+    if index is None:
+        return
+    try:
+        index.forget(topics)
+    except Exception as e:
+        print(f"Competitor index update failed: {e}")
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="全アイデア横断の競合インデックス")
+    parser.add_argument("command", choices=["export", "top"], help="export: Parquetに書き出す / top: 出現回数の多い競合を表示")
+    parser.add_argument("path", nargs="?", default="competitors.parquet", help="export の書き出し先")
+    parser.add_argument("--limit", type=int, default=20, help="top で表示する件数")
+    args = parser.parse_args()
+
+    index = get_competitor_index()
+    if index is None:
+        raise SystemExit(1)
+    if args.command == "export":
+        print(f"{index.export_parquet(args.path)} 行を {args.path} に書き出しました")
+    else:
+        for row in index.top_competitors(limit=args.limit):
+            print(f"{row['appearances']:>4}回  {row['name']}  {row['url']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import json
+import os
+import re
+
+from src.ratelimit import count_tokens
+from src.utils import extract_competitor_rows
+
+# "0" にすると、予算に関係なく前段の出力をそのまま渡す
+CONTEXT_COMPRESSION = os.getenv("CONTEXT_COMPRESSION", "1") == "1"
+
+# crewai がタスクの出力をつなぐときと同じ区切り
+_DIVIDER = "\n\n----------\n\n"
+# 要約に残す行（見出し・箇条書き・番号付きリスト・表）
+_KEEP_LINE = re.compile(r"^\s*(#{1,6}\s|[-*・]\s|\d+[.)．]\s|\|)")
+
+
+def summarize_text(text):
+    """
+    レポートから見出し・箇条書き・表と、各段落の最初の1文だけを残した要約を作る。
+    LLMを呼ばないので、要約のための待ち時間やトークンは発生しません。
+    """
+    lines = []
+    in_paragraph = False
+    for line in text.splitlines():
+        stripped = line.strip()
+        if not stripped:
+            in_paragraph = False
+            continue
+        if _KEEP_LINE.match(line):
+            lines.append(stripped)
+            in_paragraph = False
+        elif not in_paragraph:
+            # 段落の最初の1文
+            lines.append(re.split(r"(?<=[。．.!?！？])", stripped, maxsplit=1)[0])
+            in_paragraph = True
+    return "\n".join(lines)
+
+
+def compact_output(raw):
+    """
+    前段の出力を構造化した短い形にする。
+    比較表のJSONを含む出力（分析タスク）は、JSONの行＋本文の要約だけにします。
+    """
+    data = extract_competitor_rows(raw)
+    if not data:
+        return summarize_text(raw)
+    # JSONは1行1件の詰めた形にして、切り詰められても残るよう先頭に置く
+    rows = "\n".join(json.dumps(row, ensure_ascii=False, separators=(",", ":")) for row in data)
+    start = re.search(r"```json|\[\s*\{", raw)
+    body = raw[:start.start()] if start else raw
+    return f"比較表（JSON）:\n{rows}\n\n{summarize_text(body)}".strip()
+
+
+def truncate_to_tokens(text, budget, model=None):
+    """行単位で、トークン数が budget に収まるところまで切り詰める"""
+    if budget <= 0:
+        return ""
+    kept, used = [], 0
+    for line in text.splitlines():
+        tokens = count_tokens(line + "\n", model)
+        if used + tokens > budget:
+            break
+        kept.append(line)
+        used += tokens
+    return "\n".join(kept)
+
+
+def build_context(context_outputs, budget=None, model=None):
+    """
+    タスクに渡すコンテキストを、トークン数の予算内に収めて作る。
+    前段の出力をそのまま渡すと予算を超える場合だけ、各出力を compact_output で
+    構造化した要約にし、予算を出力ごとに均等に割り振って切り詰めます。
+
+    戻り値は (コンテキスト文字列, 元のトークン数, 渡すトークン数)。
+    """
+    full = _DIVIDER.join(output.raw for output in context_outputs)
+    full_tokens = count_tokens(full, model) if full else 0
+    if not CONTEXT_COMPRESSION or budget is None or full_tokens <= budget:
+        return full, full_tokens, full_tokens
+
+    sections = [
+        (f"【{output.agent} の報告（要約）】\n", compact_output(output.raw))
+        for output in context_outputs
+    ]
+    sizes = [count_tokens(body, model) for _, body in sections]
+    remaining = budget - count_tokens(_DIVIDER, model) * (len(sections) - 1)
+    parts = [""] * len(sections)
+    # 短い要約から割り振り、余った分はまだ割り振っていない（長い）出力に回す
+    order = sorted(range(len(sections)), key=lambda i: sizes[i])
+    for n, i in enumerate(order):
+        header, body = sections[i]
+        share = remaining // (len(sections) - n)
+        parts[i] = header + truncate_to_tokens(body, share - count_tokens(header, model), model)
+        remaining -= count_tokens(parts[i], model)
+
+    # 行ごとに数えた合計と、つないだ後のトークン数はずれることがあるので、
+    # つないだものを数え直して、予算を超えていれば末尾の行から削る
+    lines = _DIVIDER.join(parts).splitlines()
+    context_tokens = count_tokens("\n".join(lines), model)
+    while lines and context_tokens > budget:
+        lines.pop()
+        context_tokens = count_tokens("\n".join(lines), model)
+    return "\n".join(lines), full_tokens, context_tokens
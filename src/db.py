@@ -0,0 +1,23 @@
+import sqlite3
+import threading
+
+
+class ThreadLocalSQLite:
+    """
+    スレッドごとに SQLite 接続を保持するヘルパー。
+    sqlite3 の接続はスレッドをまたいで使えないため、Streamlit の各セッションや
+    ワーカースレッドはそれぞれ自分の接続を使います（WALモードで読み書きを並行化）。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
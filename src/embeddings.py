@@ -0,0 +1,66 @@
+import os
+
+import numpy as np
+import onnxruntime
+from chromadb.api.types import Documents, EmbeddingFunction, Embeddings
+from chromadb.utils.embedding_functions import register_embedding_function
+from huggingface_hub import hf_hub_download
+from tokenizers import Tokenizer
+
+# 類似アイデア検索に使う埋め込みモデル（Hugging Face のリポジトリ名）。
+# chromadb のデフォルト（all-MiniLM-L6-v2）は英語専用で、日本語の短い入力では
+# 内容が違っても似たベクトルになりやすいため、50以上の言語で学習された
+# paraphrase-multilingual-MiniLM-L12-v2 を使います（384次元、ONNX版をCPUで実行）。
+SIMILARITY_EMBEDDING_MODEL = os.getenv(
+    "SIMILARITY_EMBEDDING_MODEL", "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+)
+# 埋め込むテキストの最大トークン数（それ以降は切り捨てる）
+_MAX_TOKENS = 256
+
+
+@register_embedding_function
+class MultilingualEmbeddingFunction(EmbeddingFunction[Documents]):
+    """
+    sentence-transformers のモデルの ONNX 版を onnxruntime で動かす埋め込み関数。
+    torch を入れずに、chromadb と同じ onnxruntime・tokenizers だけで多言語のモデルを使えます。
+    モデルは初回に Hugging Face からダウンロードされ、以降はローカルのキャッシュを使います。
+    """
+
+    def __init__(self, model_name=SIMILARITY_EMBEDDING_MODEL):
+        self.model_name = model_name
+        self._tokenizer = Tokenizer.from_file(hf_hub_download(model_name, "tokenizer.json"))
+        self._tokenizer.enable_truncation(max_length=_MAX_TOKENS)
+        self._tokenizer.enable_padding()
+        self._session = onnxruntime.InferenceSession(
+            hf_hub_download(model_name, "onnx/model.onnx"), providers=["CPUExecutionProvider"]
+        )
+        self._input_names = {i.name for i in self._session.get_inputs()}
+
+    def __call__(self, input: Documents) -> Embeddings:
+        encodings = self._tokenizer.encode_batch(list(input))
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self._input_names:
+            feeds["token_type_ids"] = np.zeros_like(input_ids)
+        token_embeddings = self._session.run(None, feeds)[0]
+
+        # sentence-transformers と同じく、パディング以外のトークンの平均をとって正規化する
+        mask = attention_mask[..., None].astype(np.float32)
+        embeddings = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        embeddings /= np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        return [e.astype(np.float32) for e in embeddings]
+
+    @staticmethod
+    def name():
+        return "onnx_multilingual_minilm"
+
+    def default_space(self):
+        return "cosine"
+
+    def get_config(self):
+        return {"model_name": self.model_name}
+
+    @staticmethod
+    def build_from_config(config):
+        return MultilingualEmbeddingFunction(config.get("model_name", SIMILARITY_EMBEDDING_MODEL))
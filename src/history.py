@@ -0,0 +1,400 @@
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import unicodedata
+import zlib
+
+from src.db import ThreadLocalSQLite
+
+HISTORY_FILE = "history.json"
+HISTORY_DB = os.getenv("HISTORY_DB", "history.db")
+# "sqlite"（デフォルト）または "json"
+HISTORY_BACKEND = os.getenv("HISTORY_BACKEND", "sqlite")
+# 保存しておく履歴の上限（件数・合計サイズ・経過日数）。0 なら制限しない
+# 上限を超えたら、最後に表示（キャッシュヒット）された日時が古いものから削除します
+HISTORY_MAX_ENTRIES = int(os.getenv("HISTORY_MAX_ENTRIES", "500"))
+HISTORY_MAX_BYTES = int(os.getenv("HISTORY_MAX_BYTES", str(200 * 1024 * 1024)))
+HISTORY_MAX_AGE_DAYS = float(os.getenv("HISTORY_MAX_AGE_DAYS", "180"))
+
+
+def normalize_topic(topic):
+    """
+    履歴のキーに使うため、トピックの表記ゆれ（全角・半角、インデント、空白の数、空行）をそろえる。
+    内容が同じなら入力の書き方が違っても同じキーになります。
+    """
+    text = unicodedata.normalize("NFKC", topic or "")
+    lines = (re.sub(r"\s+", " ", line).strip() for line in text.splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+class HistoryStore:
+    """履歴ストアの共通インターフェース（トピック単位で読み書きする）"""
+
+    def get(self, topic):
+        """トピックの履歴を1件返す。無ければ None"""
+        raise NotImplementedError
+
+    def put(self, topic, report, df_data, complete=True):
+        """
+        トピックの履歴を1件だけ書き込む（上書き）。
+        complete=False は実行途中の結果で、キャッシュとしては使われません。
+        途中の結果で、同じトピックの完了した履歴を上書きすることはありません
+        （再実行が失敗・中断しても、前回の結果はキャッシュとして残ります）。
+        """
+        raise NotImplementedError
+
+    def load_all(self):
+        """全履歴を {topic: {"report": ..., "df_data": ..., "complete": ...}} の形で返す"""
+        raise NotImplementedError
+
+    def touch(self, topic):
+        """キャッシュとして使われたことを記録する（古い履歴から削除するときの順番に使います）"""
+
+    def vacuum(self):
+        """
+        上限を超えた履歴を削除して保存ファイルを詰め、
+        {"before_bytes", "after_bytes", "reclaimed_bytes", ...} を返す。
+        """
+        raise NotImplementedError
+
+
+class JsonHistoryStore(HistoryStore):
+    """
+    従来の history.json をそのまま使うストア（ロック＋アトミック書き込み付き）。
+    件数と経過日数の上限だけを守ります（合計サイズの上限・LRU・圧縮は SQLite 版のみ）。
+    """
+
+    def __init__(self, path=HISTORY_FILE, max_entries=HISTORY_MAX_ENTRIES, max_age_days=HISTORY_MAX_AGE_DAYS):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age_days * 24 * 60 * 60
+        self._lock = threading.Lock()
+
+    def load_all(self):
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        return {}
+
+    def get(self, topic):
+        key = normalize_topic(topic)
+        # 古いファイルには正規化前のキーも残っているので、キーをそろえて探す
+        for stored_topic, entry in self.load_all().items():
+            if normalize_topic(stored_topic) == key:
+                entry.setdefault("complete", True)
+                return entry
+        return None
+
+    def put(self, topic, report, df_data, complete=True):
+        key = normalize_topic(topic)
+        with self._lock:
+            if not complete:
+                existing = self.get(key)
+                if existing and existing["complete"]:
+                    return
+            history = {
+                stored_topic: entry for stored_topic, entry in self.load_all().items()
+                if normalize_topic(stored_topic) != key
+            }
+            now = time.time()
+            history[key] = {
+                "report": report,
+                "df_data": df_data,
+                "complete": complete,
+                "updated_at": now,
+            }
+            kept = self._apply_limits(history, now)
+            self._write(kept)
+        _forget_topics([topic for topic in history if topic not in kept])
+
+    def vacuum(self):
+        with self._lock:
+            before = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+            history = self.load_all()
+            kept = self._apply_limits(history, time.time())
+            self._write(kept)
+            after = os.path.getsize(self.path)
+        _forget_topics([topic for topic in history if topic not in kept])
+        return {
+            "before_bytes": before,
+            "after_bytes": after,
+            "reclaimed_bytes": before - after,
+            "compressed": 0,
+            "removed": len(history) - len(kept),
+        }
+
+    def _apply_limits(self, history, now):
+        # 書き込んだ順に並んでいるので、古いもの（先頭）から上限を超えた分を捨てる
+        if self.max_age:
+            history = {
+                t: e for t, e in history.items() if now - e.get("updated_at", now) <= self.max_age
+            }
+        if self.max_entries and len(history) > self.max_entries:
+            history = dict(list(history.items())[-self.max_entries:])
+        return history
+
+    def _write(self, history):
+        # 一時ファイルに書いてから置き換えることで、書き込み途中の破損を防ぐ
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(history, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp_path, self.path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+
+
+class SQLiteHistoryStore(HistoryStore):
+    """
+    SQLite（WALモード）に1トピック1行で保存するストア。
+    読み込みはキー指定の1行取得、保存は1行のUPSERTだけで済みます。
+    レポート本文は zlib で圧縮して保存し、件数・合計サイズ・経過日数の上限を超えたら
+    最後に使われた日時（touch）が古いものから削除します。
+    """
+
+    def __init__(self, path=HISTORY_DB, legacy_json=HISTORY_FILE, max_entries=HISTORY_MAX_ENTRIES,
+                 max_bytes=HISTORY_MAX_BYTES, max_age_days=HISTORY_MAX_AGE_DAYS):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age_days * 24 * 60 * 60
+        self._db = ThreadLocalSQLite(path)
+        self._init_db()
+        if legacy_json:
+            self._import_legacy_json(legacy_json)
+
+    def _connect(self):
+        return self._db.connect()
+
+    def _init_db(self):
+        conn = self._connect()
+        with conn:
+            # last_access は最後にキャッシュとして使われた日時、size は保存サイズ（圧縮後のバイト数）
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS history (
+                    topic TEXT PRIMARY KEY,
+                    report TEXT NOT NULL,
+                    df_data TEXT,
+                    complete INTEGER NOT NULL DEFAULT 1,
+                    updated_at REAL NOT NULL,
+                    last_access REAL,
+                    size INTEGER NOT NULL DEFAULT 0
+                )
+                """
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)"
+            )
+
+    def _import_legacy_json(self, json_path):
+        """初回起動時に既存の history.json を取り込む（1度だけ）"""
+        conn = self._connect()
+        imported = conn.execute(
+            "SELECT value FROM meta WHERE key = 'legacy_json_imported'"
+        ).fetchone()
+        if imported or not os.path.exists(json_path):
+            return
+
+        with open(json_path, "r", encoding="utf-8") as f:
+            legacy = json.load(f)
+
+        now = time.time()
+        with conn:
+            # 既にSQLite側にある（新しい）データは上書きしない
+            conn.executemany(
+                "INSERT OR IGNORE INTO history (topic, report, df_data, updated_at, size) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (normalize_topic(topic), report_blob, df_json, now, _row_size(report_blob, df_json))
+                    for topic, report_blob, df_json in (
+                        (topic, _dump_report(entry.get("report", "")), _dump_df_data(entry.get("df_data")))
+                        for topic, entry in legacy.items()
+                    )
+                ]
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('legacy_json_imported', ?)",
+                (str(now),)
+            )
+
+    def get(self, topic):
+        row = self._connect().execute(
+            "SELECT report, df_data, complete FROM history WHERE topic = ?", (normalize_topic(topic),)
+        ).fetchone()
+        if row is None:
+            return None
+        return {"report": _load_report(row[0]), "df_data": _load_df_data(row[1]), "complete": bool(row[2])}
+
+    def put(self, topic, report, df_data, complete=True):
+        report_blob = _dump_report(report)
+        df_json = _dump_df_data(df_data)
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                """
+                INSERT INTO history (topic, report, df_data, complete, updated_at, last_access, size)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(topic) DO UPDATE SET
+                    report = excluded.report,
+                    df_data = excluded.df_data,
+                    complete = excluded.complete,
+                    updated_at = excluded.updated_at,
+                    last_access = excluded.last_access,
+                    size = excluded.size
+                WHERE excluded.complete = 1 OR history.complete = 0
+                """,
+                (normalize_topic(topic), report_blob, df_json, int(complete), now, now,
+                 _row_size(report_blob, df_json))
+            )
+            # 途中経過の保存（タスクごと）では削除せず、完了したときだけ上限を確認する
+            removed = self._evict(conn, now) if complete else []
+        _forget_topics(removed)
+
+    def touch(self, topic):
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "UPDATE history SET last_access = ? WHERE topic = ?", (time.time(), normalize_topic(topic))
+            )
+
+    def _evict(self, conn, now):
+        """上限を超えた履歴を削除し、削除したトピックを返す（呼び出し側のトランザクション内で実行）"""
+        removed = []
+        if self.max_age:
+            removed += [
+                topic for (topic,) in conn.execute(
+                    "DELETE FROM history WHERE updated_at < ? RETURNING topic", (now - self.max_age,)
+                ).fetchall()
+            ]
+
+        # 最近使われた順に数えて、件数・合計サイズの上限からはみ出した分を削除する
+        rows = conn.execute(
+            "SELECT topic, size FROM history ORDER BY COALESCE(last_access, updated_at) DESC"
+        ).fetchall()
+        total = 0
+        stale = []
+        for count, (topic, size) in enumerate(rows, 1):
+            total += size
+            if (self.max_entries and count > self.max_entries) or (self.max_bytes and total > self.max_bytes):
+                stale.append((topic,))
+        if stale:
+            conn.executemany("DELETE FROM history WHERE topic = ?", stale)
+        return removed + [topic for (topic,) in stale]
+
+    def vacuum(self):
+        """
+        未圧縮の古い行を圧縮し、上限を超えた履歴を削除してから VACUUM でファイルを詰める。
+        {"before_bytes", "after_bytes", "reclaimed_bytes", "compressed", "removed"} を返します。
+        """
+        before = self._file_size()
+        conn = self._connect()
+        with conn:
+            rows = conn.execute(
+                "SELECT topic, report, df_data FROM history WHERE typeof(report) = 'text'"
+            ).fetchall()
+            for topic, report, df_json in rows:
+                report_blob = _dump_report(report)
+                conn.execute(
+                    "UPDATE history SET report = ?, size = ? WHERE topic = ?",
+                    (report_blob, _row_size(report_blob, df_json), topic)
+                )
+            removed = self._evict(conn, time.time())
+        _forget_topics(removed)
+        conn.execute("VACUUM")
+        after = self._file_size()
+        return {
+            "before_bytes": before,
+            "after_bytes": after,
+            "reclaimed_bytes": before - after,
+            "compressed": len(rows),
+            "removed": len(removed),
+        }
+
+    def _file_size(self):
+        # WAL の中身もデータベースファイルに書き戻してから測る
+        self._connect().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return sum(
+            os.path.getsize(self.path + suffix)
+            for suffix in ("", "-wal") if os.path.exists(self.path + suffix)
+        )
+
+    def load_all(self):
+        rows = self._connect().execute(
+            "SELECT topic, report, df_data, complete FROM history ORDER BY updated_at"
+        ).fetchall()
+        return {
+            topic: {"report": _load_report(report), "df_data": _load_df_data(df_data), "complete": bool(complete)}
+            for topic, report, df_data, complete in rows
+        }
+
+
+def _forget_topics(topics):
+    """削除した履歴のトピックを、全アイデア横断の競合インデックスからも取り除く"""
+    if topics:
+        # src.competitors はこのモジュールを読み込むので、循環しないよう呼び出し時にインポートする
+        from src.competitors import forget_competitors
+
+        forget_competitors(topics)
+
+
+def _dump_report(report):
+    return zlib.compress(report.encode("utf-8"), 6)
+
+
+def _row_size(report_blob, df_json):
+    return len(report_blob) + len((df_json or "").encode("utf-8"))
+
+
+def _load_report(raw):
+    # 圧縮前の形式で保存された行（文字列）もそのまま読めるようにする
+    return raw if isinstance(raw, str) else zlib.decompress(raw).decode("utf-8")
+
+
+def _dump_df_data(df_data):
+    return None if df_data is None else json.dumps(df_data, ensure_ascii=False)
+
+
+def _load_df_data(raw):
+    return None if raw is None else json.loads(raw)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_history_store():
+    """設定（HISTORY_BACKEND）に応じた履歴ストアを返す（プロセス内で共有）"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if HISTORY_BACKEND == "json":
+                    _store = JsonHistoryStore()
+                else:
+                    _store = SQLiteHistoryStore()
+    return _store
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="履歴ストアのメンテナンス")
+    parser.add_argument("command", choices=["vacuum"], help="vacuum: 古い履歴の削除・圧縮とファイルの詰め直し")
+    parser.parse_args()
+
+    result = get_history_store().vacuum()
+    mb = 1024 * 1024
+    print(
+        f"{result['before_bytes'] / mb:.2f}MB -> {result['after_bytes'] / mb:.2f}MB "
+        f"（{result['reclaimed_bytes'] / mb:.2f}MB 削減, 圧縮 {result['compressed']} 件, 削除 {result['removed']} 件）"
+    )
+
+
+if __name__ == "__main__":
+    main()
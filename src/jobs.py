@@ -0,0 +1,233 @@
+import importlib
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from src.db import ThreadLocalSQLite
+from src.metrics import timed
+from src.similarity import get_similarity_index
+from src.templates import AGENT_TEMPLATES, TASK_TEMPLATES
+
+JOBS_DB = os.getenv("JOBS_DB", "jobs.db")
+# 同時に実行するクルー（ジョブ）数の上限
+JOB_MAX_CONCURRENT = int(os.getenv("JOB_MAX_CONCURRENT", "2"))
+# 終わった（完了・失敗した）ジョブを残しておく日数。0 なら削除しない
+JOB_MAX_AGE_DAYS = float(os.getenv("JOB_MAX_AGE_DAYS", "7"))
+# "1" なら warm_up() で、クルーの実行に必要なモジュールを先に読み込んでおく
+CREW_PREWARM = os.getenv("CREW_PREWARM", "1") == "1"
+
+
+class JobQueue:
+    """
+    クルーの実行をバックグラウンドで行うローカルのジョブキュー。
+    ジョブの状態と、終わったタスクの出力（チェックポイント）を SQLite に保存するので、
+    ブラウザの再読み込みやサーバーの再起動、途中の失敗があっても
+    最後に終わったタスクの続きから再開できます。
+    チェックポイントはジョブが完了したら消し、終わったジョブは JOB_MAX_AGE_DAYS 日で削除します。
+    """
+
+    def __init__(self, path=JOBS_DB, max_concurrent=JOB_MAX_CONCURRENT, max_age_days=JOB_MAX_AGE_DAYS):
+        self.max_age = max_age_days * 24 * 60 * 60
+        self._db = ThreadLocalSQLite(path)
+        self._pool = ThreadPoolExecutor(max_workers=max(1, max_concurrent), thread_name_prefix="crew-job")
+        with self._db.connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    topic TEXT NOT NULL,
+                    task_names TEXT NOT NULL,
+                    use_cache INTEGER NOT NULL,
+                    status TEXT NOT NULL,
+                    error TEXT,
+                    report TEXT,
+                    df_data TEXT,
+                    seed_competitors TEXT,
+                    search_options TEXT,
+                    prefetched_results TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS job_checkpoints (
+                    job_id TEXT NOT NULL,
+                    task_index INTEGER NOT NULL,
+                    agent TEXT NOT NULL,
+                    raw TEXT NOT NULL,
+                    PRIMARY KEY (job_id, task_index)
+                )
+                """
+            )
+        self._prune()
+        self._resume_interrupted()
+
+    def submit(self, topic, task_names, use_cache=True, seed_competitors=None, search_options=None,
+               prefetched_results=None):
+        """
+        ジョブを登録して実行待ちに入れ、ジョブIDを返す。
+        seed_competitors・search_options・prefetched_results は run_crew にそのまま渡します。
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        seed = None if not seed_competitors else json.dumps(seed_competitors, ensure_ascii=False)
+        search = None if not search_options else json.dumps(search_options)
+        prefetched = None if not prefetched_results else json.dumps(prefetched_results, ensure_ascii=False)
+        conn = self._db.connect()
+        with conn:
+            conn.execute(
+                "INSERT INTO jobs (id, topic, task_names, use_cache, status, seed_competitors, search_options, prefetched_results, created_at, updated_at) VALUES (?, ?, ?, ?, 'queued', ?, ?, ?, ?, ?)",
+                (job_id, topic, json.dumps(task_names), int(use_cache), seed, search, prefetched, now, now)
+            )
+        self._pool.submit(self._run, job_id)
+        return job_id
+
+    def retry(self, job_id):
+        """失敗したジョブを、終わっているタスクの続きから再実行する"""
+        self._set_status(job_id, "queued", error=None)
+        self._pool.submit(self._run, job_id)
+
+    def get(self, job_id):
+        """
+        ジョブの状態を辞書で返す（無ければ None）。
+        outputs には {タスクのindex: 出力テキスト} として終わったタスクの結果が入ります。
+        """
+        conn = self._db.connect()
+        row = conn.execute(
+            "SELECT topic, task_names, status, error, report, df_data FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        topic, task_names, status, error, report, df_data = row
+        task_names = json.loads(task_names)
+        return {
+            "id": job_id,
+            "topic": topic,
+            "status": status,
+            "error": error,
+            "roles": [AGENT_TEMPLATES[TASK_TEMPLATES[name]['agent']]['role'] for name in task_names],
+            "outputs": self._load_checkpoints(job_id),
+            "report": report,
+            "df_data": None if df_data is None else json.loads(df_data),
+        }
+
+    def _load_checkpoints(self, job_id):
+        rows = self._db.connect().execute(
+            "SELECT task_index, raw FROM job_checkpoints WHERE job_id = ?", (job_id,)
+        ).fetchall()
+        return dict(rows)
+
+    def _save_checkpoint(self, job_id, task_index, task_output):
+        conn = self._db.connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO job_checkpoints (job_id, task_index, agent, raw) VALUES (?, ?, ?, ?)",
+                (job_id, task_index, task_output.agent, task_output.raw)
+            )
+
+    def _set_status(self, job_id, status, **fields):
+        fields["status"] = status
+        fields["updated_at"] = time.time()
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        conn = self._db.connect()
+        with conn:
+            conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+    def _run(self, job_id):
+        # crewai などの重いモジュールは、ジョブを実行するときに初めて読み込む
+        from src.runner import run_crew
+
+        row = self._db.connect().execute(
+            "SELECT topic, task_names, use_cache, seed_competitors, search_options, prefetched_results FROM jobs WHERE id = ?",
+            (job_id,)
+        ).fetchone()
+        topic, task_names, use_cache, seed, search, prefetched = row
+        self._set_status(job_id, "running")
+
+        try:
+            full_report, df_data = run_crew(
+                topic, json.loads(task_names), use_cache=bool(use_cache),
+                completed=self._load_checkpoints(job_id),
+                on_task_complete=lambda i, output: self._save_checkpoint(job_id, i, output),
+                run_id=job_id,
+                seed_competitors=None if seed is None else json.loads(seed),
+                search_options=None if search is None else json.loads(search),
+                prefetched_results=None if prefetched is None else json.loads(prefetched)
+            )
+        except Exception as e:
+            print(f"Job {job_id} failed: {e}")
+            self._set_status(job_id, "failed", error=str(e))
+            return
+
+        self._set_status(
+            job_id, "done", report=full_report,
+            df_data=None if df_data is None else json.dumps(df_data, ensure_ascii=False)
+        )
+        # 完了したジョブはレポートから表示するので、途中の出力は要らない
+        conn = self._db.connect()
+        with conn:
+            conn.execute("DELETE FROM job_checkpoints WHERE job_id = ?", (job_id,))
+        self._prune()
+
+    def _prune(self):
+        """期限を過ぎた終了済みのジョブ（とそのチェックポイント）を削除する"""
+        if not self.max_age:
+            return
+        cutoff = time.time() - self.max_age
+        conn = self._db.connect()
+        with conn:
+            conn.execute(
+                """
+                DELETE FROM job_checkpoints WHERE job_id IN (
+                    SELECT id FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?
+                )
+                """,
+                (cutoff,)
+            )
+            conn.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?", (cutoff,))
+
+    def _resume_interrupted(self):
+        # 前回のプロセスが終了したときに実行待ち・実行中だったジョブを再開する
+        rows = self._db.connect().execute(
+            "SELECT id FROM jobs WHERE status IN ('queued', 'running') ORDER BY created_at"
+        ).fetchall()
+        for (job_id,) in rows:
+            self._pool.submit(self._run, job_id)
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def warm_up():
+    """
+    クルーの実行に必要なモジュール（crewai・litellm など）と類似アイデアの索引を
+    バックグラウンドのスレッドで読み込んでおく。画面の表示はこれを待ちません。
+    """
+    if not CREW_PREWARM:
+        return
+
+    def load():
+        try:
+            with timed("crew.warmup"):
+                importlib.import_module("src.runner")
+                get_similarity_index()
+        except Exception as e:
+            print(f"Warm-up failed: {e}")
+
+    threading.Thread(target=load, name="crew-warmup", daemon=True).start()
+
+
+def get_job_queue():
+    """プロセス内で共有するジョブキューを返す"""
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = JobQueue()
+    return _queue
@@ -0,0 +1,123 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+# 計測イベントを1行1JSONで追記するファイル（デフォルトは空文字で、書き出さない）
+METRICS_TRACE_FILE = os.getenv("METRICS_TRACE_FILE", "")
+# トレースファイルがこのサイズを超えたら <ファイル名>.1 に退避して新しく書き始める（0 なら退避しない）
+METRICS_TRACE_MAX_BYTES = int(os.getenv("METRICS_TRACE_MAX_BYTES", str(50 * 1024 * 1024)))
+
+# 今どの実行（ジョブ）の中で計測しているか。タスクを実行するスレッドで設定します
+current_run_id = contextvars.ContextVar("current_run_id", default=None)
+
+
+class MetricsRecorder:
+    """
+    計測イベント（処理名・所要時間・属性）を記録する。
+    直近のイベントはメモリに持ち（画面の「実行プロファイル」用）、
+    同時に JSONL のトレースファイルへ追記し（指定したときだけ）、Prometheus 形式の集計値も更新します。
+    """
+
+    def __init__(self, trace_file=METRICS_TRACE_FILE, keep=5000, max_trace_bytes=METRICS_TRACE_MAX_BYTES):
+        self.trace_file = trace_file
+        self.max_trace_bytes = max_trace_bytes
+        self._trace_size = None
+        self._events = deque(maxlen=keep)
+        self._lock = threading.Lock()
+        # (メトリクス名, ラベル) -> 値
+        self._counters = defaultdict(float)
+
+    def record(self, name, wall_sec=None, run_id=None, **attrs):
+        """イベントを1件記録する"""
+        event = {
+            "ts": time.time(),
+            "name": name,
+            "run_id": run_id or current_run_id.get(),
+            "wall_sec": wall_sec,
+            **attrs,
+        }
+        labels = (("name", name),)
+        if "agent" in attrs:
+            labels += (("agent", attrs["agent"]),)
+
+        with self._lock:
+            self._events.append(event)
+            if wall_sec is not None:
+                self._counters[("app_span_seconds_count", labels)] += 1
+                self._counters[("app_span_seconds_sum", labels)] += wall_sec
+            if "cache" in attrs:
+                self._counters[("app_cache_requests_total", labels + (("result", attrs["cache"]),))] += 1
+            for kind in ("prompt_tokens", "completion_tokens"):
+                if attrs.get(kind):
+                    self._counters[("app_tokens_total", labels + (("kind", kind),))] += attrs[kind]
+            if name == "task" and attrs.get("context_tokens_saved"):
+                self._counters[("app_context_tokens_saved_total", labels)] += attrs["context_tokens_saved"]
+            if attrs.get("retries"):
+                self._counters[("app_retries_total", labels)] += attrs["retries"]
+            if self.trace_file:
+                self._write_trace(json.dumps(event, ensure_ascii=False) + "\n")
+
+    def _write_trace(self, line):
+        # ロックを取った状態で呼ぶ。サイズは書き込んだ分を数えて、毎回ファイルを調べない
+        if self._trace_size is None:
+            self._trace_size = os.path.getsize(self.trace_file) if os.path.exists(self.trace_file) else 0
+        data = line.encode("utf-8")
+        if self.max_trace_bytes and self._trace_size and self._trace_size + len(data) > self.max_trace_bytes:
+            os.replace(self.trace_file, self.trace_file + ".1")
+            self._trace_size = 0
+        with open(self.trace_file, "ab") as f:
+            f.write(data)
+        self._trace_size += len(data)
+
+    def run_events(self, run_id):
+        """指定した実行のイベントを古い順に返す"""
+        with self._lock:
+            return [event for event in self._events if event["run_id"] == run_id]
+
+    def render_prometheus(self):
+        """集計値を Prometheus のテキスト形式で返す"""
+        with self._lock:
+            counters = sorted(self._counters.items())
+        lines = []
+        for (metric, labels), value in counters:
+            label_text = ",".join(f'{key}="{str(val).replace(chr(34), chr(39))}"' for key, val in labels)
+            lines.append(f"{metric}{{{label_text}}} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+_recorder = None
+_recorder_lock = threading.Lock()
+
+
+def get_recorder():
+    """プロセス内で共有する MetricsRecorder を返す"""
+    global _recorder
+    if _recorder is None:
+        with _recorder_lock:
+            if _recorder is None:
+                _recorder = MetricsRecorder()
+    return _recorder
+
+
+@contextmanager
+def timed(name, run_id=None, **attrs):
+    """
+    with ブロックの所要時間を計測して記録する。
+    yield される辞書に値を入れると、イベントの属性として一緒に記録されます。
+
+        with timed("search", query=query) as info:
+            info["cache"] = "hit"
+    """
+    info = dict(attrs)
+    started = time.perf_counter()
+    try:
+        yield info
+    except Exception as e:
+        info["error"] = str(e)
+        raise
+    finally:
+        get_recorder().record(name, time.perf_counter() - started, run_id, **info)
@@ -0,0 +1,285 @@
+import hashlib
+import ipaddress
+import os
+import re
+import socket
+import threading
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import httpx
+import lxml.html
+
+from src.db import ThreadLocalSQLite
+from src.metrics import timed
+
+PAGE_CACHE_DB = os.getenv("PAGE_CACHE_DB", "page_cache.db")
+# この時間内に取得したページは再検証せずにキャッシュを使う（時間単位）
+PAGE_CACHE_TTL_HOURS = float(os.getenv("PAGE_CACHE_TTL_HOURS", "24"))
+# 同時に取得するページ数と、同じホストへの同時接続数の上限
+PAGE_FETCH_MAX_WORKERS = int(os.getenv("PAGE_FETCH_MAX_WORKERS", "8"))
+PAGE_FETCH_PER_HOST = int(os.getenv("PAGE_FETCH_PER_HOST", "2"))
+PAGE_FETCH_TIMEOUT = float(os.getenv("PAGE_FETCH_TIMEOUT", "10"))
+# "1" にすると、プライベート・ループバック・リンクローカルのアドレスのページも取得する
+PAGE_FETCH_ALLOW_PRIVATE = os.getenv("PAGE_FETCH_ALLOW_PRIVATE", "0") == "1"
+# 1ページから読み込む最大バイト数（それ以上は読み捨てる）
+PAGE_MAX_BYTES = int(os.getenv("PAGE_MAX_BYTES", str(2 * 1024 * 1024)))
+# エージェントに渡す抜粋の文字数（1ページあたり・全体）
+PAGE_EXCERPT_CHARS = int(os.getenv("PAGE_EXCERPT_CHARS", "800"))
+PAGE_EXCERPT_TOTAL_CHARS = int(os.getenv("PAGE_EXCERPT_TOTAL_CHARS", "4000"))
+
+_USER_AGENT = "Mozilla/5.0 (compatible; CompetitiveResearchBot/1.0)"
+# 本文とみなさない要素
+_DROP_TAGS = ("script", "style", "noscript", "nav", "header", "footer", "aside", "form", "iframe", "svg")
+
+
+def extract_main_text(html):
+    """
+    HTML（文字列またはバイト列）から本文らしい部分のテキストを取り出す。
+    article / main があればその中だけを、無ければ body 全体から
+    メニューやスクリプトなどを除いた段落・見出し・リストを使います。
+    """
+    if isinstance(html, str):
+        # 文字列にXML宣言（encoding指定）が残っていると lxml が読み込めない
+        html = re.sub(r"^\s*<\?xml[^>]*>", "", html)
+    try:
+        root = lxml.html.fromstring(html)
+    except Exception:
+        return ""
+    for element in root.xpath("|".join(f"//{tag}" for tag in _DROP_TAGS)):
+        element.drop_tree()
+
+    container = (root.xpath("//article") or root.xpath("//main") or root.xpath("//body") or [root])[0]
+    blocks = []
+    for element in container.iter("h1", "h2", "h3", "p", "li", "td"):
+        text = re.sub(r"\s+", " ", element.text_content()).strip()
+        if len(text) >= 10:
+            blocks.append(text)
+    if not blocks:
+        blocks = [re.sub(r"\s+", " ", container.text_content()).strip()]
+    return "\n".join(blocks)
+
+
+class PageCache:
+    """
+    取得したページの本文のディスクキャッシュ。
+    ETag / Last-Modified も保存しておき、期限切れ後は条件付きリクエストで再検証します。
+    """
+
+    def __init__(self, path=PAGE_CACHE_DB, ttl_hours=PAGE_CACHE_TTL_HOURS):
+        self.ttl = ttl_hours * 60 * 60
+        self._db = ThreadLocalSQLite(path)
+        with self._db.connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS pages (
+                    url TEXT PRIMARY KEY,
+                    etag TEXT,
+                    last_modified TEXT,
+                    text TEXT NOT NULL,
+                    fetched_at REAL NOT NULL
+                )
+                """
+            )
+
+    def get(self, url):
+        """{"etag", "last_modified", "text", "fresh"} を返す（無ければ None）"""
+        row = self._db.connect().execute(
+            "SELECT etag, last_modified, text, fetched_at FROM pages WHERE url = ?", (url,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            "etag": row[0],
+            "last_modified": row[1],
+            "text": row[2],
+            "fresh": time.time() - row[3] <= self.ttl,
+        }
+
+    def put(self, url, text, etag=None, last_modified=None):
+        conn = self._db.connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO pages (url, etag, last_modified, text, fetched_at) VALUES (?, ?, ?, ?, ?)",
+                (url, etag, last_modified, text, time.time())
+            )
+
+    def touch(self, url):
+        """304 Not Modified のとき、取得日時だけを更新する"""
+        conn = self._db.connect()
+        with conn:
+            conn.execute("UPDATE pages SET fetched_at = ? WHERE url = ?", (time.time(), url))
+
+
+def is_public_host(host):
+    """
+    ホスト名が、インターネット上のアドレスだけに解決されるかどうか。
+    プライベート・ループバック・リンクローカル（クラウドのメタデータサーバーなど）のアドレスが
+    1つでも含まれれば False を返します。
+    """
+    try:
+        infos = socket.getaddrinfo(host, None, proto=socket.IPPROTO_TCP)
+    except (socket.gaierror, UnicodeError):
+        return False
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0].split("%")[0])
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        if not address.is_global:
+            return False
+    return bool(infos)
+
+
+class PageFetcher:
+    """
+    検索結果のページを並列に取得して本文を取り出す。
+    httpx のクライアント（コネクションプール）を全スレッドで共有し、
+    同じホストへの同時接続数はホストごとのセマフォで制限します。
+    allow_private=False なら、プライベートなどのアドレスには（リダイレクト先も含めて）接続しません。
+    """
+
+    def __init__(self, cache=None, max_workers=PAGE_FETCH_MAX_WORKERS, per_host=PAGE_FETCH_PER_HOST,
+                 timeout=PAGE_FETCH_TIMEOUT, allow_private=PAGE_FETCH_ALLOW_PRIVATE):
+        self.cache = cache or PageCache()
+        self.max_workers = max_workers
+        self.per_host = per_host
+        self.allow_private = allow_private
+        self._client = httpx.Client(
+            timeout=httpx.Timeout(timeout, connect=min(timeout, 5.0)),
+            limits=httpx.Limits(max_connections=max_workers * per_host, max_keepalive_connections=max_workers),
+            follow_redirects=True,
+            headers={"User-Agent": _USER_AGENT, "Accept-Language": "ja,en;q=0.8"},
+            # リダイレクトのたびにも呼ばれるので、リダイレクト先も接続前に確認できる
+            event_hooks={"request": [self._check_request]},
+        )
+        self._host_slots = {}
+        self._host_lock = threading.Lock()
+
+    def _check_request(self, request):
+        # 検索結果（やリダイレクト）の URL から、社内ネットワークなどに接続しないようにする
+        if not self.allow_private and not is_public_host(request.url.host):
+            raise ValueError(f"公開されていないアドレスには接続しません: {request.url.host}")
+
+    def _host_slot(self, url):
+        host = urlsplit(url).netloc.lower()
+        with self._host_lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(self.per_host)
+            return self._host_slots[host]
+
+    def fetch_text(self, url, use_cache=True):
+        """1ページの本文を返す（取得できなければ空文字）"""
+        with timed("page.fetch", host=urlsplit(url).netloc) as info:
+            cached = self.cache.get(url) if use_cache else None
+            if cached and cached["fresh"]:
+                info["cache"] = "hit"
+                return cached["text"]
+
+            headers = {}
+            if cached and cached["etag"]:
+                headers["If-None-Match"] = cached["etag"]
+            if cached and cached["last_modified"]:
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+            try:
+                with self._host_slot(url):
+                    with self._client.stream("GET", url, headers=headers) as response:
+                        if response.status_code == 304 and cached:
+                            info["cache"] = "revalidated"
+                            self.cache.touch(url)
+                            return cached["text"]
+                        response.raise_for_status()
+                        if "html" not in response.headers.get("content-type", "html"):
+                            info["cache"] = "skip"
+                            return ""
+                        body = bytearray()
+                        for chunk in response.iter_bytes():
+                            body.extend(chunk)
+                            if len(body) >= PAGE_MAX_BYTES:
+                                # チャンク単位で読むので、上限を超えた分は切り捨てる
+                                del body[PAGE_MAX_BYTES:]
+                                break
+                        # ヘッダーに文字コードが無ければ、<meta charset> を見て lxml に判定させる
+                        html = bytes(body)
+                        if response.charset_encoding:
+                            html = html.decode(response.charset_encoding, errors="replace")
+                        etag = response.headers.get("etag")
+                        last_modified = response.headers.get("last-modified")
+            except Exception as e:
+                # 取れなかったページは検索結果の概要だけで済ませる
+                info["cache"] = "error"
+                info["error"] = str(e)
+                return cached["text"] if cached else ""
+
+            info["cache"] = "miss"
+            text = extract_main_text(html)
+            self.cache.put(url, text, etag=etag, last_modified=last_modified)
+            return text
+
+    def fetch_many(self, urls, use_cache=True):
+        """複数のページを並列に取得し、{url: 本文} を返す"""
+        urls = list(dict.fromkeys(urls))
+        if not urls:
+            return {}
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(urls)))) as pool:
+            texts = pool.map(lambda url: self.fetch_text(url, use_cache), urls)
+            return dict(zip(urls, texts))
+
+
+def _fingerprint(text):
+    # 記号・空白・大文字小文字の違いは無視して同じ段落とみなす（中身が無ければ None）
+    text = re.sub(r"\W+", "", unicodedata.normalize("NFKC", text).lower())
+    return hashlib.sha1(text.encode("utf-8")).hexdigest() if text else None
+
+
+def build_excerpts(results, texts, per_page=PAGE_EXCERPT_CHARS, total=PAGE_EXCERPT_TOTAL_CHARS):
+    """
+    検索結果に、ページ本文の抜粋を 'excerpt' として付ける。
+    別のページや検索結果の概要と同じ段落（定型文・共通フッターなど）は除き、
+    1ページあたり per_page 文字、全体で total 文字までに収めます。
+    """
+    seen = {_fingerprint(r.get("snippet", "")) for r in results}
+    remaining = total
+    enriched = []
+    for r in results:
+        excerpt = []
+        size = 0
+        limit = min(per_page, remaining)
+        for block in texts.get(r["url"], "").splitlines():
+            fingerprint = _fingerprint(block)
+            if fingerprint is None or fingerprint in seen:
+                continue
+            seen.add(fingerprint)
+            if size + len(block) > limit:
+                if size < limit:
+                    excerpt.append(block[:limit - size] + "…")
+                    size = limit
+                break
+            excerpt.append(block)
+            size += len(block)
+        remaining -= size
+        enriched.append({**r, "excerpt": "\n".join(excerpt)} if excerpt else dict(r))
+    return enriched
+
+
+_fetcher = None
+_fetcher_lock = threading.Lock()
+
+
+def get_page_fetcher():
+    """プロセス内で共有するページ取得クライアントを返す"""
+    global _fetcher
+    if _fetcher is None:
+        with _fetcher_lock:
+            if _fetcher is None:
+                _fetcher = PageFetcher()
+    return _fetcher
+
+
+def enrich_results(results, use_cache=True):
+    """検索結果のページを並列に取得し、本文の抜粋を付けた結果を返す"""
+    with timed("page.enrich", pages=len(results)):
+        texts = get_page_fetcher().fetch_many([r["url"] for r in results], use_cache)
+        return build_excerpts(results, texts)
@@ -0,0 +1,174 @@
+import os
+import re
+import threading
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+
+from src.history import normalize_topic
+from src.metrics import timed
+from src.similarity import find_similar_topics
+from src.utils import load_history_data
+
+# 入力中に検索などを先読みするか（画面のチェックボックスの初期値）
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "0") == "1"
+# 入力が変わらないまま、この秒数が経ったら先読みを始める
+PREFETCH_DEBOUNCE_SEC = float(os.getenv("PREFETCH_DEBOUNCE_SEC", "1.5"))
+# 調査開始時に、実行中の先読みの完了を待つ最大秒数（画面が止まるので短くする）
+PREFETCH_WAIT_SEC = float(os.getenv("PREFETCH_WAIT_SEC", "1"))
+PREFETCH_MAX_WORKERS = int(os.getenv("PREFETCH_MAX_WORKERS", "2"))
+# 先読みの結果を残しておく時間（秒）と、セッション数の上限（古いものから捨てる）
+PREFETCH_TTL_SEC = float(os.getenv("PREFETCH_TTL_SEC", "900"))
+PREFETCH_MAX_SESSIONS = int(os.getenv("PREFETCH_MAX_SESSIONS", "100"))
+
+
+def build_prefetch_queries(product_name, target_audience=""):
+    """プロダクト名（とターゲットの1行目）から、先読みする検索クエリを作る"""
+    name = re.sub(r"\s+", " ", unicodedata.normalize("NFKC", product_name)).strip()
+    if not name:
+        return []
+    queries = [f"{name} 競合 類似サービス", f"{name} 比較"]
+    target = target_audience.strip().splitlines()[0].strip() if target_audience.strip() else ""
+    if target:
+        queries.append(f"{name} {target[:30]}")
+    return queries
+
+
+class Prefetcher:
+    """
+    ヒアリングシートの入力中に、調査開始時に必要になる処理を裏で先に済ませておく。
+    - 履歴の確認と、似たアイデアの検索
+    - プロダクト名での Web 検索（検索キャッシュも温まります）
+
+    セッションごとに世代番号を持ち、入力が変わると新しい世代を予約して古い先読みは捨てます。
+    予約してから PREFETCH_DEBOUNCE_SEC 秒は待ち、その間に入力が変われば何もしません。
+    終了したセッションの結果が残り続けないよう、古い先読みは時間・件数の上限で捨てます。
+    """
+
+    def __init__(self, debounce=PREFETCH_DEBOUNCE_SEC, max_workers=PREFETCH_MAX_WORKERS,
+                 ttl=PREFETCH_TTL_SEC, max_sessions=PREFETCH_MAX_SESSIONS):
+        self.debounce = debounce
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._pool = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="prefetch")
+        self._lock = threading.Lock()
+        self._entries = {}  # session_id -> 最新の世代の先読み
+
+    def schedule(self, session_id, topic, queries, max_results=5, fetch_pages=False):
+        """先読みを予約する（同じ入力の先読みが予約済みなら何もしない）。世代番号を返す"""
+        key = (normalize_topic(topic), tuple(queries), max_results, fetch_pages)
+        with self._lock:
+            self._evict(time.time())
+            current = self._entries.get(session_id)
+            if current and current["key"] == key:
+                return current["generation"]
+            if current:
+                # 古い先読みは待ち時間を打ち切らせて、すぐに終わらせる
+                current["wake"].set()
+            entry = {
+                "generation": (current["generation"] + 1) if current else 1,
+                "key": key,
+                "status": "pending",
+                "history": None,
+                "similar": [],
+                "results": None,
+                "created_at": time.time(),
+                "wake": threading.Event(),
+                "lookups_done": threading.Event(),
+                "done": threading.Event(),
+            }
+            self._entries[session_id] = entry
+        self._pool.submit(self._run, session_id, entry, topic, list(queries), max_results, fetch_pages)
+        return entry["generation"]
+
+    def cancel(self, session_id):
+        """このセッションの先読みを取り消す"""
+        with self._lock:
+            entry = self._entries.pop(session_id, None)
+        if entry:
+            entry["wake"].set()
+
+    def _evict(self, now):
+        """期限切れの先読みと、上限を超えた古いセッションの先読みを捨てる（ロックを取った状態で呼ぶ）"""
+        expired = [sid for sid, entry in self._entries.items() if now - entry["created_at"] > self.ttl]
+        overflow = len(self._entries) - len(expired) - self.max_sessions + 1
+        if overflow > 0:
+            alive = sorted((entry["created_at"], sid) for sid, entry in self._entries.items() if sid not in expired)
+            expired += [sid for _, sid in alive[:overflow]]
+        for sid in expired:
+            self._entries.pop(sid)["wake"].set()
+
+    def _is_current(self, session_id, entry):
+        with self._lock:
+            return self._entries.get(session_id) is entry
+
+    def _run(self, session_id, entry, topic, queries, max_results, fetch_pages):
+        try:
+            # デバウンス：入力が変わる（または調査が開始される）と待ちを打ち切る
+            entry["wake"].wait(self.debounce)
+            if not self._is_current(session_id, entry):
+                entry["status"] = "cancelled"
+                return
+            with timed("prefetch", queries=len(queries)) as info:
+                entry["status"] = "running"
+                entry["history"] = load_history_data(topic)
+                if entry["history"] and entry["history"]["complete"]:
+                    # 履歴で済むので、検索はしない
+                    info["result"] = "history"
+                    entry["status"] = "ready"
+                    return
+                entry["similar"] = find_similar_topics(topic, threshold=0.0, limit=1)
+                entry["lookups_done"].set()
+                if not self._is_current(session_id, entry):
+                    info["result"] = entry["status"] = "cancelled"
+                    return
+                # ddgs・httpx は重いので、実際に検索するときに初めて読み込む
+                from src.tools import search_competitors_batch
+
+                entry["results"] = search_competitors_batch(queries, max_results=max_results,
+                                                            fetch_pages=fetch_pages)
+                info["result"] = "search"
+                entry["status"] = "ready"
+        except Exception as e:
+            print(f"Prefetch failed: {e}")
+            entry["status"] = "failed"
+        finally:
+            entry["lookups_done"].set()
+            entry["done"].set()
+
+    def take(self, session_id, topic, queries, max_results=5, fetch_pages=False, wait=PREFETCH_WAIT_SEC):
+        """
+        調査開始時に、同じ入力の先読みの結果を受け取る。
+        デバウンス中・実行中なら待ちを打ち切って、最大 wait 秒まで完了を待ちます。
+        結果は {"history", "similar", "results"} の辞書です。検索が間に合わなければ
+        results は None（履歴・類似検索だけ済んでいればそれだけ）で、何も使えなければ None を返します。
+        """
+        key = (normalize_topic(topic), tuple(queries), max_results, fetch_pages)
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None or entry["key"] != key:
+                return None
+        with timed("prefetch.take") as info:
+            entry["wake"].set()
+            entry["done"].wait(wait)
+            info["status"] = entry["status"]
+            if entry["status"] == "ready":
+                return {"history": entry["history"], "similar": entry["similar"], "results": entry["results"]}
+            if entry["status"] == "running" and entry["lookups_done"].is_set():
+                # 検索の完了は待たずに調査を始める（検索は裏で続き、検索キャッシュに残ります）
+                return {"history": entry["history"], "similar": entry["similar"], "results": None}
+            return None
+
+
+_prefetcher = None
+_prefetcher_lock = threading.Lock()
+
+
+def get_prefetcher():
+    """プロセス内で共有する先読みの実行役を返す"""
+    global _prefetcher
+    if _prefetcher is None:
+        with _prefetcher_lock:
+            if _prefetcher is None:
+                _prefetcher = Prefetcher()
+    return _prefetcher
@@ -0,0 +1,303 @@
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+RATE_LIMIT_DB = os.getenv("RATE_LIMIT_DB", "ratelimit.db")
+
+# プロバイダごとの上限（requests/min, tokens/min）。tpm が None ならトークン数は見ない
+PROVIDER_LIMITS = {
+    "gemini": {
+        "rpm": float(os.getenv("GEMINI_RPM", "15")),
+        "tpm": float(os.getenv("GEMINI_TPM", "1000000")),
+    },
+    "ddgs": {
+        "rpm": float(os.getenv("DDGS_RPM", "20")),
+        "tpm": None,
+    },
+}
+
+# リトライ回数と待ち時間（秒）
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "4"))
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "2"))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "60"))
+
+# ヘッジ（遅い呼び出しの複製）を有効にするプロバイダと、発動するレイテンシのパーセンタイル
+HEDGE_PROVIDERS = {p for p in os.getenv("HEDGE_PROVIDERS", "ddgs").split(",") if p}
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_SAMPLES = 20
+
+# リトライする HTTP ステータスコード（タイムアウト・レート制限・サーバー側の一時的なエラー）
+_RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+# ステータスコードを持たない例外のうち、リトライするもののクラス名（親クラスも含めて判定する）。
+# 各ライブラリを読み込まずに判定できるよう、クラスそのものではなく名前で持つ
+#   httpx: TimeoutException・NetworkError / ddgs: RatelimitException・TimeoutException
+#   openai・litellm: APITimeoutError・APIConnectionError / requests: Timeout・ConnectionError
+_RETRYABLE_ERROR_TYPES = {
+    "TimeoutException", "NetworkError", "RatelimitException", "APITimeoutError", "APIConnectionError",
+    "Timeout", "ConnectionError",
+}
+
+
+def estimate_tokens(text):
+    """トークン数の概算（日本語混じりの文章で1トークン≒2〜4文字程度）"""
+    return max(1, len(text or "") // 3)
+
+
+# トークン数を数えるトークナイザ（Hugging Face のリポジトリ名、空にすると概算だけを使う）。
+# Gemini のトークナイザは公開されていないので、同じく SentencePiece 系で多言語の語彙を持つ
+# paraphrase-multilingual-MiniLM-L12-v2（類似アイデア検索と同じモデル）の tokenizer.json で数えます
+TOKENIZER_MODEL = os.getenv("TOKENIZER_MODEL", "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
+
+_tokenizer = None
+_tokenizer_lock = threading.Lock()
+
+
+def _load_tokenizer():
+    try:
+        from huggingface_hub import hf_hub_download
+        from tokenizers import Tokenizer
+
+        tokenizer = Tokenizer.from_file(hf_hub_download(TOKENIZER_MODEL, "tokenizer.json"))
+    except Exception as e:
+        print(f"Tokenizer unavailable, falling back to estimate: {e}")
+        return False
+    tokenizer.no_truncation()
+    tokenizer.no_padding()
+    return tokenizer
+
+
+def _get_tokenizer():
+    # 初めて数えるときに読み込む（読み込めなければ False にして、以降は概算を使う）
+    global _tokenizer
+    if _tokenizer is None:
+        with _tokenizer_lock:
+            if _tokenizer is None:
+                _tokenizer = _load_tokenizer() if TOKENIZER_MODEL else False
+    return _tokenizer
+
+
+def count_tokens(text, model=None):
+    """
+    トークナイザでトークン数を数える（model は呼び出し側との互換のためで、使いません）。
+    トークナイザを読み込めない場合は estimate_tokens の概算を返します。
+    """
+    tokenizer = _get_tokenizer()
+    if tokenizer and text:
+        return len(tokenizer.encode(text, add_special_tokens=False).ids)
+    return estimate_tokens(text)
+
+
+def _status_code(error):
+    # litellm・openai は status_code、google-genai・google-api-core は code、httpx は response に持つ
+    for status in (getattr(error, "status_code", None), getattr(error, "code", None),
+                   getattr(getattr(error, "response", None), "status_code", None)):
+        if isinstance(status, int) and not isinstance(status, bool):
+            return status
+    return None
+
+
+def is_retryable(error):
+    """429やタイムアウトなど、時間をおけば成功しそうなエラーかどうか"""
+    status = _status_code(error)
+    if status is not None:
+        return status in _RETRYABLE_STATUS
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    return any(cls.__name__ in _RETRYABLE_ERROR_TYPES for cls in type(error).__mro__)
+
+
+class TokenBucketLimiter:
+    """
+    プロバイダごとのトークンバケット（requests/min と tokens/min）。
+    状態を SQLite に置き、更新を BEGIN IMMEDIATE で排他するので、
+    Streamlit の全セッションとバッチのワーカープロセスで同じ上限を共有できます。
+    """
+
+    def __init__(self, path=RATE_LIMIT_DB, limits=PROVIDER_LIMITS):
+        self.path = path
+        self.limits = limits
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS buckets (
+                    provider TEXT PRIMARY KEY,
+                    requests REAL NOT NULL,
+                    tokens REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+
+    def _connect(self):
+        # 自前でトランザクションを張るので autocommit モードで開く
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _update(self, provider, requests, tokens, force=False):
+        """
+        バケットを補充してから requests / tokens を引く。
+        足りなければ引かずに、必要な待ち時間（秒）を返す。force=True なら不足していても引く。
+        """
+        limit = self.limits[provider]
+        rpm, tpm = limit["rpm"], limit["tpm"]
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            row = conn.execute(
+                "SELECT requests, tokens, updated_at FROM buckets WHERE provider = ?", (provider,)
+            ).fetchone()
+            if row is None:
+                available_requests, available_tokens = rpm, tpm or 0
+            else:
+                elapsed = now - row[2]
+                available_requests = min(rpm, row[0] + elapsed * rpm / 60)
+                available_tokens = min(tpm, row[1] + elapsed * tpm / 60) if tpm else 0
+
+            wait_sec = 0.0
+            if available_requests < requests:
+                wait_sec = (requests - available_requests) * 60 / rpm
+            if tpm and tokens and available_tokens < min(tokens, tpm):
+                wait_sec = max(wait_sec, (min(tokens, tpm) - available_tokens) * 60 / tpm)
+
+            if wait_sec == 0 or force:
+                available_requests -= requests
+                if tpm:
+                    # consume で返した分も含めて、上限を超えては貯めない
+                    available_tokens = min(tpm, available_tokens - tokens)
+                wait_sec = 0.0
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (provider, requests, tokens, updated_at) VALUES (?, ?, ?, ?)",
+                (provider, available_requests, available_tokens, now)
+            )
+            conn.execute("COMMIT")
+            return wait_sec
+        finally:
+            conn.close()
+
+    def acquire(self, provider, tokens=0):
+        """リクエスト1回分（と概算トークン数）の枠が空くまで待つ"""
+        if provider not in self.limits:
+            return
+        while True:
+            wait_sec = self._update(provider, 1, tokens)
+            if wait_sec <= 0:
+                return
+            time.sleep(min(wait_sec, 5.0))
+
+    def try_acquire(self, provider, tokens=0):
+        """待たずに枠を取れるときだけ取って True を返す（取れなければ何も引かずに False）"""
+        if provider not in self.limits:
+            return True
+        return self._update(provider, 1, tokens) <= 0
+
+    def consume(self, provider, tokens):
+        """
+        実際に使ったトークン数と、枠を取ったときの概算との差分を後から精算する。
+        多く使っていれば引き（次の呼び出しが待つことになります）、少なければ返します。
+        """
+        if provider in self.limits and self.limits[provider]["tpm"] and tokens:
+            self._update(provider, 0, tokens, force=True)
+
+
+class LatencyTracker:
+    """プロバイダごとの直近のレイテンシを覚えておき、パーセンタイルを返す"""
+
+    def __init__(self, size=200):
+        self._samples = {}
+        self._size = size
+        self._lock = threading.Lock()
+
+    def record(self, provider, seconds):
+        with self._lock:
+            self._samples.setdefault(provider, deque(maxlen=self._size)).append(seconds)
+
+    def percentile(self, provider, pct):
+        with self._lock:
+            samples = sorted(self._samples.get(provider, ()))
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+_latency = LatencyTracker()
+_hedge_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="hedge")
+
+
+def get_rate_limiter():
+    """プロセス内で共有するレートリミッターを返す"""
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = TokenBucketLimiter()
+    return _limiter
+
+
+def _measured_call(provider, fn):
+    # レイテンシには呼び出しそのものの時間だけを記録する（レート制限の待ち時間は含めない）
+    started = time.perf_counter()
+    result = fn()
+    _latency.record(provider, time.perf_counter() - started)
+    return result
+
+
+def _timed_call(provider, fn, tokens):
+    get_rate_limiter().acquire(provider, tokens)
+    return _measured_call(provider, fn)
+
+
+def _hedged_call(provider, fn, tokens):
+    """
+    1回目の呼び出しが過去のレイテンシのパーセンタイルを超えたら、同じ呼び出しをもう1本投げて
+    先に返ってきた方を使う（遅い方の結果は捨てます）。
+    レート制限の待ちが終わってから時間を計り始め、2本目は待たずに枠を取れるときだけ投げます
+    （制限に引っかかっているときに、リクエストを倍にしないため）。
+    """
+    threshold = _latency.percentile(provider, HEDGE_PERCENTILE)
+    if threshold is None:
+        return _timed_call(provider, fn, tokens)
+
+    limiter = get_rate_limiter()
+    limiter.acquire(provider, tokens)
+    futures = [_hedge_pool.submit(_measured_call, provider, fn)]
+    done, _ = wait(futures, timeout=threshold)
+    if not done and limiter.try_acquire(provider, tokens):
+        futures.append(_hedge_pool.submit(_measured_call, provider, fn))
+    while True:
+        done, pending = wait(futures, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None or not pending:
+                return future.result()
+        futures = list(pending)
+
+
+def guarded_call(provider, fn, tokens=0, hedge=None, on_retry=None):
+    """
+    fn() をレート制限・リトライ（ジッター付き指数バックオフ）・ヘッジ付きで呼び出す。
+    tokens にはリクエストの概算トークン数を渡します。
+    on_retry(error) を渡すと、リトライするたびに呼び出します（計測用）。
+    """
+    if hedge is None:
+        hedge = provider in HEDGE_PROVIDERS
+
+    for attempt in range(RETRY_MAX_ATTEMPTS):
+        try:
+            if hedge:
+                return _hedged_call(provider, fn, tokens)
+            return _timed_call(provider, fn, tokens)
+        except Exception as e:
+            if attempt == RETRY_MAX_ATTEMPTS - 1 or not is_retryable(e):
+                raise
+            # 全員が同じタイミングで再試行しないよう、待ち時間をランダムにずらす
+            delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+            if on_retry:
+                on_retry(e)
+            time.sleep(delay)
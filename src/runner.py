@@ -0,0 +1,52 @@
+import uuid
+
+from src.crew import build_tasks
+from src.metrics import current_run_id
+from src.scheduler import run_tasks_parallel
+from src.templates import TASK_TEMPLATES
+from src.utils import build_report, extract_competitor_rows, save_history_data
+
+
+def extract_df_data(task_names, task_outputs):
+    """
+    比較表用のデータを、JSONを出力する分析タスクの出力だけから取り出す（無ければ None）。
+    取り出した行は型をそろえて履歴に保存するので、表示のたびにレポートを読み直す必要はありません。
+    """
+    if 'analysis' not in task_names:
+        return None
+    return extract_competitor_rows(task_outputs[task_names.index('analysis')].raw)
+
+
+def run_crew(topic, task_names, use_cache=True, completed=None, on_task_complete=None, run_id=None,
+             seed_competitors=None, search_options=None, prefetched_results=None):
+    """
+    1件のアイデアについてクルーを実行し、(full_report, df_data) を返す。
+    タスクが終わるたびに途中結果を履歴に complete=False で保存し、
+    最後に完成したレポートを保存します。
+    run_id を渡すと、計測イベント（src/metrics.py）をそのIDで記録します。
+    seed_competitors には、似た過去のアイデアから引き継ぐ競合リストを渡せます。
+    search_options は検索ツールの設定です（{"max_results": 5, "fetch_pages": True} など）。
+    prefetched_results には、入力中に先読みした検索結果（src/prefetch.py）を渡せます。
+    """
+    run_id = run_id or uuid.uuid4().hex
+    # 履歴の保存など、このスレッドでの計測も同じ実行として記録する
+    current_run_id.set(run_id)
+    tasks = build_tasks(task_names, seed_competitors=seed_competitors, search_options=search_options,
+                        prefetched_results=prefetched_results)
+
+    def handle_task_complete(i, task_output):
+        partial_outputs = [task.output for task in tasks if task.output is not None]
+        save_history_data(topic, build_report(partial_outputs), None, complete=False)
+        if on_task_complete:
+            on_task_complete(i, task_output)
+
+    result = run_tasks_parallel(
+        tasks, inputs={'topic': topic}, use_cache=use_cache,
+        on_task_complete=handle_task_complete, completed=completed, run_id=run_id,
+        context_budgets=[TASK_TEMPLATES[name].get('context_budget') for name in task_names]
+    )
+
+    full_report = build_report(result.tasks_output)
+    df_data = extract_df_data(task_names, result.tasks_output)
+    save_history_data(topic, full_report, df_data)
+    return full_report, df_data
@@ -0,0 +1,160 @@
+import os
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from crewai.crews.crew_output import CrewOutput
+from crewai.tasks.task_output import TaskOutput
+from crewai.types.usage_metrics import UsageMetrics
+from crewai.utilities.constants import NOT_SPECIFIED
+from src.context import build_context
+from src.metrics import current_run_id, timed
+from src.task_cache import get_task_cache, make_task_key
+
+# 同時に実行するタスク数の上限（Gemini のレート制限に合わせて調整してください）
+MAX_WORKERS = int(os.getenv("CREW_MAX_WORKERS", "4"))
+
+
+def build_dependency_graph(tasks):
+    """
+    タスクの context から依存関係（DAG）を作る。
+    戻り値は {タスクのindex: 依存先indexの集合}。
+
+    - context が明示されているタスクは、そのうち今回実行するタスクだけに依存します
+    - context が未指定のタスクは、Process.sequential と同じく「それより前の全タスク」に依存します
+    """
+    index_of = {id(task): i for i, task in enumerate(tasks)}
+    graph = {}
+    for i, task in enumerate(tasks):
+        if task.context is NOT_SPECIFIED:
+            graph[i] = set(range(i))
+        else:
+            graph[i] = {
+                index_of[id(dep)] for dep in (task.context or [])
+                if id(dep) in index_of
+            }
+    return graph
+
+
+def restore_task_output(task, raw):
+    """保存しておいた出力テキストから TaskOutput を作り直す"""
+    task.output = TaskOutput(
+        description=task.description,
+        expected_output=task.expected_output,
+        raw=raw,
+        agent=task.agent.role,
+    )
+    return task.output
+
+
+def run_tasks_parallel(tasks, inputs, max_workers=MAX_WORKERS, use_cache=True, on_task_complete=None,
+                       completed=None, run_id=None, context_budgets=None):
+    """
+    依存関係が解決したタスクから並列に実行する。
+    結果の tasks_output は渡された tasks の順番のまま返すので、
+    Crew.kickoff() の戻り値と同じように扱えます。
+
+    use_cache=True の場合、入力と前段の結果が同じタスクはキャッシュから結果を返し、
+    LLM を呼び出しません（False でも新しい結果はキャッシュに書き込みます）。
+
+    on_task_complete(index, task_output) を渡すと、タスクが1つ終わるたびに呼び出します。
+    呼び出しはこの関数を呼んだスレッドで行われるので、Streamlit の画面更新にそのまま使えます。
+
+    completed に {タスクのindex: 出力テキスト} を渡すと、そのタスクは実行済みとして扱います
+    （中断したジョブをチェックポイントから再開するときに使います）。
+
+    context_budgets には、タスクごとに前段の出力として渡すトークン数の上限を
+    tasks と同じ順番で渡せます（None は上限なし。src/context.py を参照）。
+
+    各タスクの所要時間・待ち時間・トークン数・キャッシュヒット・コンテキストの削減量は
+    run_id ごとに src/metrics.py へ記録されます。
+    """
+    run_id = run_id or uuid.uuid4().hex
+    context_budgets = context_budgets or [None] * len(tasks)
+    with timed("crew.run", run_id, tasks=len(tasks)) as run_info:
+        return _run_tasks_parallel(tasks, inputs, max_workers, use_cache, on_task_complete, completed, run_id,
+                                   context_budgets, run_info)
+
+
+def _run_tasks_parallel(tasks, inputs, max_workers, use_cache, on_task_complete, completed, run_id,
+                        context_budgets, run_info):
+    # Crew.kickoff() と同様に {topic} などのプレースホルダを埋める
+    for task in tasks:
+        task.interpolate_inputs_and_add_conversation_history(inputs)
+        task.agent.interpolate_inputs(inputs)
+
+    graph = build_dependency_graph(tasks)
+    outputs = [None] * len(tasks)
+    for i, raw in (completed or {}).items():
+        outputs[i] = restore_task_output(tasks[i], raw)
+    running = {}
+    submitted_at = {}
+    # タスクごとに、予算内に収めたことで減らせたコンテキストのトークン数
+    tokens_saved = [0] * len(tasks)
+    cache = get_task_cache()
+
+    def run_one(i):
+        # このスレッドで行われる検索などの計測も、同じ実行として記録されるようにする
+        current_run_id.set(run_id)
+        task = tasks[i]
+        queue_wait = time.perf_counter() - submitted_at[i]
+        with timed("task", run_id, agent=task.agent.role, queue_wait_sec=queue_wait) as info:
+            # 今回の実行で得られた依存先の結果だけをコンテキストとして渡す
+            context_outputs = [outputs[d] for d in sorted(graph[i])]
+            key = make_task_key(task, context_outputs, context_budgets[i])
+
+            cached_raw = cache.get(key) if use_cache else None
+            if cached_raw is not None:
+                info["cache"] = "hit"
+                return restore_task_output(task, cached_raw)
+
+            info["cache"] = "miss"
+            context, full_tokens, context_tokens = build_context(
+                context_outputs, context_budgets[i], getattr(task.agent.llm, "model", None)
+            )
+            tokens_saved[i] = full_tokens - context_tokens
+            info["context_tokens"] = context_tokens
+            info["context_tokens_saved"] = tokens_saved[i]
+            output = task.execute_sync(agent=task.agent, context=context, tools=task.agent.tools)
+            cache.put(key, task.agent.role, output.raw)
+            info.update(getattr(task.agent.llm, "usage", {}))
+            return output
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        try:
+            while True:
+                for i in range(len(tasks)):
+                    ready = all(outputs[d] is not None for d in graph[i])
+                    if outputs[i] is None and i not in running.values() and ready:
+                        submitted_at[i] = time.perf_counter()
+                        running[pool.submit(run_one, i)] = i
+
+                if not running:
+                    if any(output is None for output in outputs):
+                        raise ValueError("タスクの依存関係が循環しているため実行できません")
+                    break
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    i = running.pop(future)
+                    outputs[i] = future.result()
+                    if on_task_complete:
+                        on_task_complete(i, outputs[i])
+        finally:
+            # 途中で失敗した場合は、まだ始まっていないタスクを取り消す
+            for future in running:
+                future.cancel()
+
+    run_info["context_tokens_saved"] = sum(tokens_saved)
+    usages = [getattr(task.agent.llm, "usage", {}) for task in tasks]
+    prompt_tokens = sum(usage.get("prompt_tokens", 0) for usage in usages)
+    completion_tokens = sum(usage.get("completion_tokens", 0) for usage in usages)
+    return CrewOutput(
+        raw=outputs[-1].raw if outputs else "",
+        tasks_output=outputs,
+        token_usage=UsageMetrics(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=prompt_tokens + completion_tokens,
+        ),
+    )
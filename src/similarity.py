@@ -0,0 +1,170 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+from src.history import get_history_store, normalize_topic
+
+# 類似アイデア検索の索引（chromadb）の保存先
+SIMILARITY_DB_DIR = os.getenv("SIMILARITY_DB_DIR", "similarity_index")
+# "0" にすると索引の作成・検索を行わない
+SIMILARITY_ENABLED = os.getenv("SIMILARITY_ENABLED", "1") == "1"
+# これ以上のコサイン類似度（0〜1）なら「似たアイデア」とみなす
+SIMILARITY_THRESHOLD = float(os.getenv("SIMILARITY_THRESHOLD", "0.9"))
+# 埋め込むテキスト・モデルを変えたときは、コレクション名を変えて索引を作り直す
+SIMILARITY_COLLECTION = "topics_multilingual"
+# 索引を作れなかったとき（モデルをダウンロードできないなど）、作り直しを試すまでの秒数
+SIMILARITY_RETRY_SEC = float(os.getenv("SIMILARITY_RETRY_SEC", "300"))
+
+# build_topic（src/utils.py）が付ける項目名。全トピックに共通なので埋め込みには含めない
+_TOPIC_LABEL = re.compile(r"^【(プロダクト名|ターゲット|特徴・強み|開発者の現状)】\s*")
+
+
+def _topic_id(key):
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def topic_document(key):
+    """正規化したトピックから項目名を除き、ユーザーが入力した内容だけを埋め込み用のテキストにする"""
+    lines = (_TOPIC_LABEL.sub("", line) for line in key.splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def extract_competitors(df_data):
+    """比較表のデータから、競合（自分のプロダクト以外）の名前・URL・特徴だけを取り出す"""
+    competitors = []
+    for row in df_data or []:
+        if not isinstance(row, dict) or row.get("type") == "self" or not row.get("name"):
+            continue
+        competitors.append({
+            "name": str(row.get("name")),
+            "url": str(row.get("url") or "-"),
+            "features": str(row.get("features") or ""),
+        })
+    return competitors
+
+
+class SimilarTopicIndex:
+    """
+    保存済みのトピックを埋め込みベクトルで索引し、入力の一部だけ違う「似たアイデア」を探す。
+    各トピックには、そのときの調査で見つかった競合リストを一緒に持たせておきます。
+    """
+
+    def __init__(self, path=SIMILARITY_DB_DIR):
+        # chromadb・埋め込みモデルは読み込みが重いので、索引を使うときに初めてインポートする
+        import chromadb
+
+        from src.embeddings import MultilingualEmbeddingFunction
+
+        self._client = chromadb.PersistentClient(path=path)
+        self._collection = self._client.get_or_create_collection(
+            SIMILARITY_COLLECTION, embedding_function=MultilingualEmbeddingFunction(),
+            metadata={"hnsw:space": "cosine"}
+        )
+        self._lock = threading.Lock()
+        if self._collection.count() == 0:
+            self._backfill()
+
+    def _backfill(self):
+        """索引が空なら、既存の履歴（完了したもの）から作る"""
+        entries = [
+            (topic, entry["df_data"])
+            for topic, entry in get_history_store().load_all().items()
+            if entry.get("complete", True)
+        ]
+        for topic, df_data in entries:
+            self.add(topic, df_data)
+
+    def add(self, topic, df_data):
+        """トピックと、その調査で見つかった競合リストを索引に追加（上書き）する"""
+        key = normalize_topic(topic)
+        if not topic_document(key):
+            return
+        with self._lock:
+            self._collection.upsert(
+                ids=[_topic_id(key)],
+                documents=[topic_document(key)],
+                metadatas=[{
+                    "topic": key,
+                    "competitors": json.dumps(extract_competitors(df_data), ensure_ascii=False),
+                }],
+            )
+
+    def search(self, topic, threshold=SIMILARITY_THRESHOLD, limit=3):
+        """
+        似ている過去のトピックを類似度の高い順に返す。
+        完全に同じトピック（通常の履歴でヒットするもの）は含めません。
+
+            [{"topic": ..., "similarity": 0.95, "competitors": [{"name": ..., "url": ..., "features": ...}]}]
+        """
+        key = normalize_topic(topic)
+        if not topic_document(key) or self._collection.count() == 0:
+            return []
+        result = self._collection.query(
+            query_texts=[topic_document(key)],
+            n_results=min(limit + 1, self._collection.count()),
+            include=["metadatas", "distances"],
+        )
+        matches = []
+        for metadata, distance in zip(result["metadatas"][0], result["distances"][0]):
+            similarity = 1 - distance
+            if metadata["topic"] == key or similarity < threshold:
+                continue
+            matches.append({
+                "topic": metadata["topic"],
+                "similarity": similarity,
+                "competitors": json.loads(metadata.get("competitors") or "[]"),
+            })
+        return matches[:limit]
+
+
+_index = None
+_index_failed_at = None
+_index_lock = threading.Lock()
+
+
+def get_similarity_index():
+    """
+    プロセス内で共有する類似トピック索引を返す（無効・作成できない場合は None）。
+    作成に失敗したら SIMILARITY_RETRY_SEC 秒は作り直さず、保存・検索のたびに待たされないようにします。
+    """
+    global _index, _index_failed_at
+    if not SIMILARITY_ENABLED:
+        return None
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                if _index_failed_at is not None and time.time() - _index_failed_at < SIMILARITY_RETRY_SEC:
+                    return None
+                try:
+                    _index = SimilarTopicIndex()
+                except Exception as e:
+                    print(f"Similarity index unavailable: {e}")
+                    _index_failed_at = time.time()
+                    return None
+    return _index
+
+
+def index_topic(topic, df_data):
+    """完了した調査結果を索引に追加する。失敗しても履歴の保存は止めない"""
+    index = get_similarity_index()
+    if index is None:
+        return
+    try:
+        index.add(topic, df_data)
+    except Exception as e:
+        print(f"Similarity index update failed: {e}")
+
+
+def find_similar_topics(topic, threshold=SIMILARITY_THRESHOLD, limit=3):
+    """似ている過去のトピックを探す（索引が使えない場合は空のリスト）"""
+    index = get_similarity_index()
+    if index is None:
+        return []
+    try:
+        return index.search(topic, threshold=threshold, limit=limit)
+    except Exception as e:
+        print(f"Similarity search failed: {e}")
+        return []
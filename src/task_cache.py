@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+from src.db import ThreadLocalSQLite
+from src.history import normalize_topic
+from src.templates import strip_prefetched_results
+
+TASK_CACHE_DB = os.getenv("TASK_CACHE_DB", "task_cache.db")
+# 保存する最大件数と、有効期限（日）
+TASK_CACHE_MAX_ENTRIES = int(os.getenv("TASK_CACHE_MAX_ENTRIES", "2000"))
+TASK_CACHE_MAX_AGE_DAYS = float(os.getenv("TASK_CACHE_MAX_AGE_DAYS", "30"))
+
+
+def _sha256(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def make_task_key(task, context_outputs, context_budget=None):
+    """
+    タスク1件分のキャッシュキーを作る。
+    エージェントの役割・埋め込み済みのタスク説明・モデル名・依存タスクの出力ハッシュが
+    すべて同じときだけ同じキーになるので、前段の結果が変われば後段も自動で再実行されます。
+    タスク説明は空白・全角半角の違いを無視して比べ、先読みした検索結果の追記は含めません。
+    コンテキストの予算（src/context.py）や、検索ツールの設定（件数など）を変えた場合も別のキーになります。
+    """
+    agent = task.agent
+    llm = getattr(agent, "llm", None)
+    model = getattr(llm, "model", None) or str(llm)
+    payload = {
+        "role": agent.role,
+        "description": normalize_topic(strip_prefetched_results(task.description)),
+        "expected_output": task.expected_output,
+        "model": model,
+        "context": [_sha256(output.raw) for output in context_outputs],
+    }
+    if context_budget is not None:
+        payload["context_budget"] = context_budget
+    tools = [getattr(t, "cache_tag", t.name) for t in (getattr(agent, "tools", None) or [])]
+    if tools:
+        payload["tools"] = tools
+    return _sha256(json.dumps(payload, ensure_ascii=False, sort_keys=True))
+
+
+class TaskResultCache:
+    """タスク単位の実行結果キャッシュ（件数・経過時間で古いものから削除）"""
+
+    def __init__(self, path=TASK_CACHE_DB, max_entries=TASK_CACHE_MAX_ENTRIES,
+                 max_age_days=TASK_CACHE_MAX_AGE_DAYS):
+        self.max_entries = max_entries
+        self.max_age = max_age_days * 24 * 60 * 60
+        self._db = ThreadLocalSQLite(path)
+        with self._db.connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS task_results (
+                    key TEXT PRIMARY KEY,
+                    agent TEXT NOT NULL,
+                    raw TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+                """
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_task_results_access ON task_results (last_access)"
+            )
+
+    def get(self, key):
+        """有効なキャッシュがあれば出力テキストを返す。無ければ None"""
+        conn = self._db.connect()
+        now = time.time()
+        row = conn.execute(
+            "SELECT raw, created_at FROM task_results WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        raw, created_at = row
+        if now - created_at > self.max_age:
+            return None
+        with conn:
+            conn.execute(
+                "UPDATE task_results SET last_access = ? WHERE key = ?", (now, key)
+            )
+        return raw
+
+    def put(self, key, agent_role, raw):
+        conn = self._db.connect()
+        now = time.time()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO task_results (key, agent, raw, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, agent_role, raw, now, now)
+            )
+            self._evict(conn, now)
+
+    def _evict(self, conn, now):
+        # 期限切れを削除し、それでも多すぎる場合は最後に使われたのが古い順に削除
+        conn.execute(
+            "DELETE FROM task_results WHERE created_at < ?", (now - self.max_age,)
+        )
+        conn.execute(
+            """
+            DELETE FROM task_results WHERE key IN (
+                SELECT key FROM task_results ORDER BY last_access DESC LIMIT -1 OFFSET ?
+            )
+            """,
+            (self.max_entries,)
+        )
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_task_cache():
+    """プロセス内で共有するタスク結果キャッシュを返す"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = TaskResultCache()
+    return _cache
@@ -0,0 +1,197 @@
+import os
+from types import MappingProxyType
+
+# エージェント・タスクのテンプレート（設定値）だけを持つモジュール。
+# crewai などの重いライブラリをインポートしないので、画面の表示やジョブの登録は
+# クルーの実行に必要なモジュール（src/crew.py）を読み込まずに行えます。
+
+# 3. エージェントの定義
+#
+# エージェントとタスクは「テンプレート（設定値）」としてだけ持ち、
+# 実行のたびに build_tasks()（src/crew.py）で新しいインスタンスを作ります。
+# モジュール共通のオブジェクトを書き換えないので、複数セッションが同時に実行しても
+# あるユーザーのトピックが別のユーザーの実行に混ざることはありません。
+
+# 以前成功した名称に統一します
+gemini_llm = "gemini/gemini-flash-latest"
+
+# 検索結果のページ本文も読み込んでエージェントに渡すか（画面・バッチから実行ごとに変えられます）
+# ページの取得は検索より時間がかかるので、デフォルトでは読み込まない
+PAGE_FETCH_ENABLED = os.getenv("PAGE_FETCH_ENABLED", "0") == "1"
+
+# 全エージェント共通の設定
+AGENT_DEFAULTS = MappingProxyType({
+    'llm': gemini_llm,
+    # 【重要】AIの「自問自答」を最大1回に制限し、API消費を極限まで抑えます
+    'max_iter': 1,
+    # 【重要】他のエージェントに相談（API消費）させない設定
+    'allow_delegation': False,
+    'verbose': True,
+})
+
+AGENT_TEMPLATES = MappingProxyType({
+    'researcher': MappingProxyType({
+        'role': '競合調査リサーチャー',
+        'goal': '指定された製品の競合サービスをリストアップする',
+        'backstory': 'あなたは迅速な調査を最優先するプロフェッショナルです。',
+        'tools': ('WebSearch',), # ツール名（src/crew.py で実体に置き換えます）
+    }),
+    'writer': MappingProxyType({
+        'role': 'ビジネスアナリスト',
+        'goal': 'リサーチ結果を分析し、JSON形式のリストを作成する',
+        'backstory': 'あなたは情報を整理するプロフェッショナルです。',
+    }),
+    # 3人目のエージェント：戦略コンサルタント
+    'strategist': MappingProxyType({
+        'role': '戦略コンサルタント',
+        'goal': '競合調査レポートを元に、SWOT分析と具体的な戦略提案を行う',
+        'backstory': 'あなたはMBAを持つ経験豊富な戦略コンサルタントです。市場の機会と脅威を鋭く読み解き、実行可能な戦略を立案するのが得意です。',
+    }),
+    # 4人目：リーン・スタートアップ・コーチ
+    'coach': MappingProxyType({
+        'role': 'スタートアップ・コーチ',
+        'goal': '調査結果を元に、具体的で実行可能な「最初のアクションプラン」を提案する',
+        'backstory': 'あなたは数々の起業家を成功に導いたメンターです。「リーン・スタートアップ」の精神に基づき、無駄なく素早く仮説検証を行うためのステップを助言します。',
+    }),
+    # 5人目：辛口なターゲットユーザー（ペルソナ）
+    'persona': MappingProxyType({
+        'role': '辛口なターゲットユーザー',
+        'goal': 'ユーザー視点で、サービスを使いたいか、いくらなら払うかを本音でフィードバックする',
+        'backstory': 'あなたは新しいもの好きですが、財布の紐は固い一般ユーザーです。企業側の都合のいい理屈は一切通用しません。「自分にとってメリットがあるか」だけで厳しく判断します。',
+    }),
+    # 6人目：プロダクトマネージャー（要件定義）
+    'pdm': MappingProxyType({
+        'role': 'プロダクトマネージャー',
+        'goal': '曖昧なアイデアから、開発可能なレベルの「要件定義書」を作成する',
+        'backstory': 'あなたは仕様策定のプロフェッショナルです。「何を作るか」を明確にし、抜け漏れのない機能リストと画面設計を定義します。開発者が迷わず実装できるドキュメント品質にこだわります。',
+    }),
+    # 7人目：テックリード（基本設計）
+    'architect': MappingProxyType({
+        'role': 'テックリード',
+        'goal': '要件定義を元に、最適な技術選定と「基本設計書」を作成する',
+        'backstory': 'あなたはモダンな技術に精通したフルスタックエンジニアです。個人開発の規模感に合わせ、開発効率と保守性を両立できる技術選定（Next.js, Supabase, FastAPIなど）や、具体的なデータ構造の設計が得意です。',
+    }),
+})
+
+# 4. タスクの定義
+# context はタスク名のタプルです（今回の実行に含まれるものだけが参照されます）
+# context_budget は前段の出力として渡すトークン数の上限です。超える場合は要約・比較表のJSONに
+# 圧縮して渡します（src/context.py）。指定しないタスクには前段の出力をそのまま渡します
+TASK_TEMPLATES = MappingProxyType({
+    'research': MappingProxyType({
+        'agent': 'researcher',
+        'description': '以下のプロダクト案について市場調査を行い、競合サービスをリストアップしてください。\n\n{topic}\n\n検索結果が英語であっても、報告は必ず日本語で行ってください。',
+        'expected_output': '市場の概要、主要な競合リスト（名称と特徴）、トレンドをまとめた日本語のレポート。', # ★ここを具体的に修正
+        'context': (),
+    }),
+    'analysis': MappingProxyType({
+        'agent': 'writer',
+        'description': """
+                レポートを作成してください。
+                最後に、調査した競合サービス（3〜5つ）と、ユーザーのアイデア（自分のプロダクト）を比較するためのJSONデータを出力してください。
+                各サービスを以下の2軸で1〜10点で採点してください：
+                - functionality: 機能の豊富さ（1:単機能 〜 10:多機能・オールインワン）
+                - usability: 手軽さ・初心者への優しさ（1:難しい・専門的 〜 10:簡単・直感的）
+
+                JSON形式:
+                [
+                    {"name": "競合A", "url": "...", "features": "...", "functionality": 7, "usability": 8, "type": "competitor"},
+                    {"name": "自分のプロダクト", "url": "-", "features": "...", "functionality": 5, "usability": 9, "type": "self"}
+                ]
+                必ずこのJSONブロックのみを最後に出力してください。
+                """,
+        'expected_output': '分析レポートと、[{"サービス名": "...", "URL": "...", "特徴": "..."}] 形式のJSONデータ。',
+        'context': ('research',), # 並列実行時も調査結果を待ってから分析する
+        'context_budget': 6000, # 競合の採点に使うので、調査結果はなるべくそのまま渡す
+    }),
+    # 3つ目のタスク：戦略立案
+    'strategy': MappingProxyType({
+        'agent': 'strategist',
+        'description': 'これまでの調査結果と分析リストを元に、「{topic}」のSWOT分析（強み・弱み・機会・脅威）を行ってください。また、それに基づいた具体的な差別化戦略を3つ提案してください。',
+        'expected_output': 'SWOT分析表（Markdown形式）と、3つの戦略提案を含んだ詳細なレポート。',
+        'context': ('research', 'analysis'), # 前のタスクの結果を参照させる
+        'context_budget': 3000,
+    }),
+    # コーチのタスク
+    'coach': MappingProxyType({
+        'agent': 'coach',
+        'description': 'これまでの調査と分析を踏まえ、「{topic}」で起業するための「最初の1ヶ月のアクションプラン」を作成してください。MVP（検証用製品）の定義、顧客ヒアリングの質問リスト、最初のアプローチ方法などを具体的に提案してください。',
+        'expected_output': '1ヶ月間の週ごとのアクションリストと、検証すべき仮説リスト。',
+        'context': ('research', 'analysis', 'strategy'),
+        'context_budget': 3000,
+    }),
+    # ペルソナのタスク
+    'persona': MappingProxyType({
+        'agent': 'persona',
+        'description': 'あなたは「{topic}」の潜在的な顧客です。提案されているサービスや競合情報を見て、「自分ならこれを使うか？」「お金を払うか？」を本音で語ってください。良い点だけでなく、不満や懸念点も遠慮なく挙げてください。',
+        'expected_output': 'ユーザー視点の率直な感想、良い点・悪い点のフィードバック、利用意向の有無。',
+        'context': ('research',), # 調査結果だけ見せればOK
+        'context_budget': 1500,
+    }),
+    # PdMのタスク
+    'requirements': MappingProxyType({
+        'agent': 'pdm',
+        'description': '「{topic}」のアイデアを元に、詳細な「要件定義書」を作成してください。以下の項目を含めてください：\n1. ユーザーストーリー（誰が何をしてどうなるか）\n2. 機能要件リスト（Must/Wantで優先度付け）\n3. 必要な画面リストとその機能',
+        'expected_output': 'Markdown形式の要件定義書。',
+        'context': (), # アイデアだけで書けるので、調査チームと並列に走らせる
+    }),
+    # テックリードのタスク
+    'design': MappingProxyType({
+        'agent': 'architect',
+        'description': '要件定義書を元に、このアプリを開発するための「基本設計書」を作成してください。以下の項目を含めてください：\n1. 推奨技術スタック（Frontend, Backend, DB, Infra）とその選定理由\n2. データベース設計（テーブル定義とリレーションのER図イメージ）\n3. 主要なAPIエンドポイントの設計',
+        'expected_output': 'Markdown形式の基本設計書（mermaid記法のER図を含む）。',
+        'context': ('requirements',), # PdMの成果物を参照させる
+        'context_budget': 4000,
+    }),
+})
+
+
+# 似た過去のアイデアの競合リストを引き継ぐときに、調査タスクへ追記する文
+RESEARCH_SEED_NOTE = '\n\n参考：よく似たアイデアの過去の調査では、次の競合が見つかっています。\n{competitors}\nこれを出発点として、今回のアイデアとの違いに関係する競合の追加・見直しを中心に調査してください。'
+
+
+def format_research_seed(competitors):
+    """引き継ぐ競合リストを、調査タスクに追記する文章にする"""
+    lines = "\n".join(f"- {c['name']}（{c['url']}）: {c['features']}" for c in competitors)
+    # タスク説明の {変数} の埋め込みと衝突しないよう、波かっこは全角にしておく
+    lines = lines.replace("{", "｛").replace("}", "｝")
+    return RESEARCH_SEED_NOTE.replace("{competitors}", lines)
+
+
+# 入力中に先読みした検索結果を、調査タスクへ渡すときに追記する文
+RESEARCH_PREFETCH_NOTE = '\n\n参考：このプロダクト案で事前にWeb検索した結果です。\n{results}\nこれで足りない観点だけを追加で検索してください。'
+# 先読み結果1件あたりの概要・抜粋の文字数
+PREFETCH_SNIPPET_CHARS = 300
+
+
+def format_prefetched_results(results):
+    """先読みした検索結果を、調査タスクに追記する文章にする"""
+    lines = []
+    for r in results:
+        text = (r.get('excerpt') or r.get('snippet') or '').replace("\n", " ")[:PREFETCH_SNIPPET_CHARS]
+        lines.append(f"- {r['title']}（{r['url']}）: {text}")
+    # format_research_seed と同じく、波かっこは全角にしておく
+    lines = "\n".join(lines).replace("{", "｛").replace("}", "｝")
+    return RESEARCH_PREFETCH_NOTE.replace("{results}", lines)
+
+
+def strip_prefetched_results(description):
+    """
+    タスク説明から format_prefetched_results の追記を取り除く。
+    先読みが間に合ったかどうかで同じ入力のキャッシュキーが変わらないようにします（src/task_cache.py）。
+    """
+    return description.partition(RESEARCH_PREFETCH_NOTE.split("{results}")[0])[0]
+
+
+def select_task_names(use_strategy=True, use_coach=False, use_persona=False, use_design=True):
+    """オプションの組み合わせから、実行するタスク名を画面の表示順で返す"""
+    names = ['research', 'analysis']
+    if use_strategy:
+        names.append('strategy')
+    if use_coach:
+        names.append('coach')
+    if use_persona:
+        names.append('persona')
+    if use_design:
+        names += ['requirements', 'design']
+    return names
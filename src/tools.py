@@ -1,34 +1,194 @@
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+
 from ddgs import DDGS
 
-def search_competitors(query, max_results=5):
+from src.db import ThreadLocalSQLite
+from src.metrics import timed
+from src.pages import enrich_results
+from src.ratelimit import guarded_call
+
+SEARCH_CACHE_DB = os.getenv("SEARCH_CACHE_DB", "search_cache.db")
+# 検索結果をキャッシュしておく時間（時間単位）
+SEARCH_CACHE_TTL_HOURS = float(os.getenv("SEARCH_CACHE_TTL_HOURS", "24"))
+# バッチ検索で同時に投げるクエリ数の上限
+SEARCH_MAX_WORKERS = int(os.getenv("SEARCH_MAX_WORKERS", "4"))
+
+DEFAULT_REGION = 'jp-jp'
+DEFAULT_TIMELIMIT = 'y'
+
+
+def normalize_query(query):
+    """全角・半角や大文字・小文字、空白の違いを吸収したクエリ文字列を返す"""
+    query = unicodedata.normalize("NFKC", query).lower()
+    return re.sub(r"\s+", " ", query).strip()
+
+
+class SearchCache:
+    """検索結果のディスクキャッシュ（TTL付き）"""
+
+    def __init__(self, path=SEARCH_CACHE_DB, ttl_hours=SEARCH_CACHE_TTL_HOURS):
+        self.ttl = ttl_hours * 60 * 60
+        self._db = ThreadLocalSQLite(path)
+        with self._db.connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS search_results (
+                    key TEXT PRIMARY KEY,
+                    results TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+                """
+            )
+
+    @staticmethod
+    def make_key(query, region, timelimit, max_results):
+        return json.dumps([normalize_query(query), region, timelimit, max_results], ensure_ascii=False)
+
+    def get(self, key):
+        row = self._db.connect().execute(
+            "SELECT results, created_at FROM search_results WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or time.time() - row[1] > self.ttl:
+            return None
+        return json.loads(row[0])
+
+    def put(self, key, results):
+        conn = self._db.connect()
+        now = time.time()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO search_results (key, results, created_at) VALUES (?, ?, ?)",
+                (key, json.dumps(results, ensure_ascii=False), now)
+            )
+            conn.execute(
+                "DELETE FROM search_results WHERE created_at < ?", (now - self.ttl,)
+            )
+
+
+_cache = None
+_cache_lock = threading.Lock()
+_clients = threading.local()
+
+
+def get_search_cache():
+    """プロセス内で共有する検索キャッシュを返す"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = SearchCache()
+    return _cache
+
+
+def _get_client():
+    # 毎回 DDGS() を作り直さず、スレッドごとに1つのクライアントを使い回す
+    client = getattr(_clients, "ddgs", None)
+    if client is None:
+        client = DDGS()
+        _clients.ddgs = client
+    return client
+
+
+def search_competitors(query, max_results=5, region=DEFAULT_REGION, timelimit=DEFAULT_TIMELIMIT,
+                       use_cache=True, fetch_pages=False):
     """
     指定されたクエリで競合サービスを検索し、結果をリストで返します。
+    同じクエリ（表記ゆれを正規化したもの）の結果は一定時間キャッシュから返します。
+    fetch_pages=True の場合は、各結果のページ本文の抜粋を 'excerpt' として付けます（src/pages.py）。
     """
-    results = []
-    with DDGS() as ddgs:
+    with timed("search", query=normalize_query(query)) as info:
+        results = _search_competitors(query, max_results, region, timelimit, use_cache, info)
+    if fetch_pages:
+        results = enrich_results(results, use_cache)
+    return results
+
+
+def _search_competitors(query, max_results, region, timelimit, use_cache, info):
+    cache = get_search_cache()
+    key = cache.make_key(query, region, timelimit, max_results)
+    if use_cache:
+        cached = cache.get(key)
+        if cached is not None:
+            info["cache"] = "hit"
+            return cached
+    info["cache"] = "miss"
+    info["retries"] = 0
+
+    def run_search():
         # textメソッドでWeb検索を実行
-        search_results = ddgs.text(query, 
-                                   region='jp-jp', 
-                                   safesearch='off', 
-                                   timelimit='y', 
-                                   max_results=max_results)
-        
-        for r in search_results:
-            results.append({
-                'title': r['title'],
-                'url': r['href'],
-                'snippet': r['body']
-            })
+        return list(_get_client().text(query,
+                                       region=region,
+                                       safesearch='off',
+                                       timelimit=timelimit,
+                                       max_results=max_results))
+
+    # レート制限・リトライ・ヘッジ付きで呼び出す
+    search_results = guarded_call(
+        "ddgs", run_search,
+        on_retry=lambda e: info.update(retries=info["retries"] + 1)
+    )
+
+    results = []
+    for r in search_results:
+        results.append({
+            'title': r['title'],
+            'url': r['href'],
+            'snippet': r['body']
+        })
+
+    cache.put(key, results)
     return results
 
+
+def search_competitors_batch(queries, max_results=5, region=DEFAULT_REGION, timelimit=DEFAULT_TIMELIMIT,
+                             use_cache=True, max_workers=SEARCH_MAX_WORKERS, fetch_pages=False):
+    """
+    複数のクエリを並列に検索し、URLの重複を除いた結果を1つのリストにまとめて返します。
+    結果の並びは queries の順番（同じクエリ内では検索順位順）です。
+    fetch_pages=True の場合は、重複を除いた後の結果のページ本文を取得します。
+    """
+    # 表記ゆれだけが違うクエリは1回にまとめる
+    unique = {}
+    for q in queries:
+        unique.setdefault(normalize_query(q), q)
+    queries = list(unique.values())
+    if not queries:
+        return []
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(queries)))) as pool:
+        result_lists = list(pool.map(
+            lambda q: search_competitors(q, max_results, region, timelimit, use_cache),
+            queries
+        ))
+
+    merged = []
+    seen_urls = set()
+    for results in result_lists:
+        for r in results:
+            url = r['url'].rstrip('/')
+            if url in seen_urls:
+                continue
+            seen_urls.add(url)
+            merged.append(r)
+    if fetch_pages:
+        merged = enrich_results(merged, use_cache)
+    return merged
+
+
 if __name__ == "__main__":
     # テスト実行
     test_query = "タスク管理アプリ 競合 類似サービス"
     print(f"「{test_query}」を検索中...")
-    
+
     findings = search_competitors(test_query)
-    
+
     for i, result in enumerate(findings, 1):
         print(f"\n[{i}] {result['title']}")
         print(f"URL: {result['url']}")
-        print(f"概要: {result['snippet'][:100]}...") 
\ No newline at end of file
+        print(f"概要: {result['snippet'][:100]}...")
@@ -1,56 +1,176 @@
 import json
-import os
 import re
 
-HISTORY_FILE = "history.json"
-
-def load_history_data():
-    """履歴ファイルを読み込む"""
-    if os.path.exists(HISTORY_FILE):
-        with open(HISTORY_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return {}
-
-def save_history_data(topic, report, df_data):
-    """結果を履歴ファイルに保存する"""
-    history = load_history_data()
-    history[topic] = {
-        "report": report,
-        "df_data": df_data
-    }
-    with open(HISTORY_FILE, "w", encoding="utf-8") as f:
-        json.dump(history, f, ensure_ascii=False, indent=4)
+import json_repair
+
+from src.competitors import index_competitors
+from src.history import HISTORY_FILE, get_history_store
+from src.metrics import timed
+from src.similarity import index_topic
+
+def load_history_data(topic=None):
+    """
+    履歴を読み込む。
+    topic を指定した場合はそのトピックの1件（無ければ None）を、
+    省略した場合は全履歴の辞書を返します。
+    """
+    store = get_history_store()
+    if topic is None:
+        with timed("history.load_all"):
+            return store.load_all()
+    with timed("history.load") as info:
+        entry = store.get(topic)
+        info["cache"] = "hit" if entry and entry["complete"] else "miss"
+        # キャッシュとして使われた履歴は、上限を超えたときに削除されにくくする
+        if info["cache"] == "hit":
+            store.touch(topic)
+        return entry
+
+def save_history_data(topic, report, df_data, complete=True):
+    """
+    結果を履歴ストアに保存する（該当トピックの1件だけを書き込む）。
+    実行途中の結果は complete=False で保存します。
+    """
+    with timed("history.save", complete=complete):
+        get_history_store().put(topic, report, df_data, complete)
+    # 完了した結果だけを類似アイデア検索の索引と、競合インデックスに載せる
+    if complete:
+        with timed("similarity.index"):
+            index_topic(topic, df_data)
+        with timed("competitors.index"):
+            index_competitors(topic, df_data)
+
+def build_topic(product_name, target_audience="", main_features="", context_info=""):
+    """ヒアリングシートの入力を結合して、クルーに渡す「トピック」を作る"""
+    if not product_name:
+        return ""
+    return f"""
+    【プロダクト名】{product_name}
+    【ターゲット】{target_audience}
+    【特徴・強み】{main_features}
+    【開発者の現状】{context_info}
+    """
 
 def clean_topic_name(text):
     """ファイル名に使えない文字を除去して安全なトピック名にする"""
     return re.sub(r'[\\/:*?"<>|]+', '', text)
 
-# src/utils.py の該当関数をこれに書き換え
+_json_decoder = json.JSONDecoder()
+
+
+def _is_table(data):
+    return isinstance(data, list) and bool(data) and all(isinstance(row, dict) for row in data)
+
 
 def extract_json_from_text(text):
-    """テキスト内にあるJSONブロック({...}や[...])を抽出する"""
-    try:
-        # パターン1: マークダウンのコードブロック ```json ... ``` で囲まれている場合
-        code_block_match = re.search(r'```json\s*(.*?)\s*```', text, re.DOTALL)
-        if code_block_match:
-            json_str = code_block_match.group(1)
-            return json.loads(json_str)
-
-        # パターン2: 直接書かれている場合
-        # 普通の [ ] だと引用 [1] などに反応してしまうため、
-        # 「 [ の直後に { がある（間に空白・改行OK）」というパターンを探す
-        json_match = re.search(r'(\[\s*\{.*\}\s*\])', text, re.DOTALL)
-        if json_match:
-            json_str = json_match.group(1)
-            return json.loads(json_str)
-            
-    except Exception as e:
-        # デバッグ用: 解析失敗の理由をターミナルに出しても良い
-        print(f"JSON Parse Error: {e}")
-        pass
-    
+    """
+    テキスト内にあるJSONブロック（[{...}, ...] や {...}）を抽出する。
+    「[ の直後に {」が来る位置から順に raw_decode で1つのJSONだけを読むので、
+    正規表現で全体をなめ回さず、後ろにある別の文章を巻き込むこともありません。
+    前から読み、読めたJSONの内側（入れ子のリスト）は飛ばして、最後に出てくる表を優先します。
+    どれも読めなければ json_repair で壊れたJSONの修復を試みます。
+    """
+    if not text:
+        return None
+
+    # パターン1: マークダウンのコードブロック ```json ... ``` の中身（最後のものを優先）
+    blocks = re.findall(r"```json\s*(.*?)```", text, re.DOTALL)
+    for block in reversed(blocks):
+        try:
+            data, _ = _json_decoder.raw_decode(block.strip())
+        except json.JSONDecodeError:
+            continue
+        if _is_table(data) or isinstance(data, dict):
+            return data
+
+    # パターン2: 直接書かれている場合（引用 [1] などに反応しないよう「[ の直後に {」に限る）
+    starts = [m.start() for m in re.finditer(r"\[\s*\{", text)]
+    tables = []
+    end = 0
+    for start in starts:
+        if start < end:
+            # 読めたJSONの内側にある入れ子のリストは候補にしない
+            continue
+        try:
+            data, end = _json_decoder.raw_decode(text, start)
+        except json.JSONDecodeError:
+            continue
+        if _is_table(data):
+            tables.append(data)
+    if tables:
+        return tables[-1]
+
+    # どれもJSONとして読めない場合は、LLMがよく出す崩れ（末尾のカンマ・閉じ忘れなど）を修復する
+    candidates = [block.strip() for block in reversed(blocks)] + [text[start:] for start in reversed(starts)]
+    for source in candidates:
+        try:
+            data = json_repair.loads(source)
+        except Exception:
+            continue
+        if _is_table(data):
+            return data
     return None
 
+
+def _to_score(value):
+    """1〜10点の採点を数値にそろえる（"7点" のような文字列も受け付ける）。読めなければ None"""
+    if isinstance(value, str):
+        match = re.search(r"\d+(\.\d+)?", value)
+        value = match.group(0) if match else None
+    try:
+        score = float(value)
+    except (TypeError, ValueError):
+        return None
+    return min(10.0, max(1.0, score))
+
+
+def validate_competitor_rows(data):
+    """
+    抽出したJSONを比較表（name / url / features / functionality / usability / type）の行として検証し、
+    型をそろえたリストを返す（1行も無ければ None）。
+    name が無い行や、採点（functionality / usability）が数値にできない行は除きます。
+    """
+    if isinstance(data, dict):
+        data = [data]
+    if not isinstance(data, list):
+        return None
+
+    rows = []
+    for item in data:
+        if not isinstance(item, dict) or not str(item.get("name") or "").strip():
+            continue
+        functionality = _to_score(item.get("functionality"))
+        usability = _to_score(item.get("usability"))
+        if functionality is None or usability is None:
+            continue
+        features = item.get("features") or ""
+        if isinstance(features, list):
+            # 箇条書きのリストで返ってきた特徴は1つの文にまとめる
+            features = "、".join(str(f) for f in features)
+        rows.append({
+            "name": str(item["name"]).strip(),
+            "url": str(item.get("url") or "-").strip(),
+            "features": str(features).strip(),
+            "functionality": functionality,
+            "usability": usability,
+            "type": "self" if item.get("type") == "self" else "competitor",
+        })
+    return rows or None
+
+
+def extract_competitor_rows(text):
+    """テキストから比較表のJSONを抽出・検証して、型をそろえた行のリストを返す（無ければ None）"""
+    return validate_competitor_rows(extract_json_from_text(text))
+
+def build_report(task_outputs):
+    """タスクの出力を「## 👤 役割 の報告」形式で1つのレポートにまとめる"""
+    full_report = ""
+    for task_output in task_outputs:
+        agent_role = getattr(task_output, 'agent', '担当エージェント')
+        full_report += f"## 👤 {agent_role} の報告\n\n"
+        full_report += str(task_output) + "\n\n---\n\n"
+    return full_report
+
 def split_report_by_agent(report_text):
     """レポートをエージェントごとのセクションに分割する"""
     try:
@@ -0,0 +1,13 @@
+import os
+import sys
+import tempfile
+
+# src パッケージをリポジトリのルートから読み込めるようにする
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 計測イベントなどをテスト中に作業ディレクトリへ書き出さないようにする
+_WORK_DIR = tempfile.mkdtemp(prefix="tests_")
+for _name, _file in [("METRICS_TRACE_FILE", "traces.jsonl"), ("PAGE_CACHE_DB", "page_cache.db")]:
+    os.environ.setdefault(_name, os.path.join(_WORK_DIR, _file))
+# トークナイザをダウンロードしない（必要なテストでは小さなトークナイザを差し込む）
+os.environ.setdefault("TOKENIZER_MODEL", "")
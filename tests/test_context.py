@@ -0,0 +1,56 @@
+from types import SimpleNamespace
+
+import pytest
+from tokenizers import Tokenizer, models, pre_tokenizers, trainers
+
+import src.ratelimit as ratelimit
+from src.context import build_context, truncate_to_tokens
+from src.ratelimit import count_tokens
+
+_REPORT = """# 競合調査レポート
+タスク管理アプリの市場は拡大しています。個人向けと法人向けで機能が分かれます。
+- Todoist: 締め切りの管理が得意です。
+- Notion: ドキュメントとタスクをまとめて扱えます。
+| 名前 | 特徴 |
+| Asana | チームでの進捗管理 |
+"""
+
+
+@pytest.fixture
+def tokenizer(monkeypatch):
+    # 改行をまたいで結合する BPE にして、行ごとの合計と全体のトークン数がずれるようにする
+    tokenizer = Tokenizer(models.BPE(unk_token="[UNK]"))
+    tokenizer.pre_tokenizer = pre_tokenizers.Split("。", behavior="merged_with_previous")
+    tokenizer.train_from_iterator([_REPORT * 5], trainers.BpeTrainer(vocab_size=300, special_tokens=["[UNK]"]))
+    monkeypatch.setattr(ratelimit, "_tokenizer", tokenizer)
+    return tokenizer
+
+
+def _outputs(n):
+    return [SimpleNamespace(agent=f"エージェント{i}", raw=_REPORT * 20) for i in range(n)]
+
+
+def test_count_tokens_uses_tokenizer(tokenizer):
+    assert count_tokens(_REPORT) == len(tokenizer.encode(_REPORT, add_special_tokens=False).ids)
+
+
+@pytest.mark.parametrize("budget", [20, 60, 150])
+def test_build_context_fits_budget(tokenizer, budget):
+    outputs = _outputs(3)
+    context, full_tokens, context_tokens = build_context(outputs, budget=budget)
+
+    assert full_tokens > budget
+    assert context_tokens == count_tokens(context) <= budget
+
+
+def test_build_context_passes_through_when_within_budget(tokenizer):
+    outputs = _outputs(1)
+    context, full_tokens, context_tokens = build_context(outputs, budget=10 ** 6)
+    assert context == outputs[0].raw
+    assert full_tokens == context_tokens
+
+
+def test_truncate_to_tokens_keeps_whole_lines():
+    text = truncate_to_tokens(_REPORT, 30)
+    assert _REPORT.startswith(text)
+    assert count_tokens(text) <= 30
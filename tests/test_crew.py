@@ -0,0 +1,69 @@
+from types import SimpleNamespace
+
+import pytest
+
+import src.crew as crew
+
+
+class _FakeLLM:
+    """呼び出し時の停止語を記録し、API が返したことにした使用量を積み上げる LLM"""
+
+    def __init__(self, model):
+        self.model = model
+        self.stop = []
+        self.calls = []
+        self.reported = {"prompt_tokens": 0, "completion_tokens": 0}
+
+    def call(self, messages, *args, **kwargs):
+        self.calls.append(list(self.stop))
+        self.reported["prompt_tokens"] += 1200
+        self.reported["completion_tokens"] += 300
+        return "Thought: 調べます\nObservation: 結果"
+
+    def get_token_usage_summary(self):
+        return SimpleNamespace(**self.reported)
+
+
+class _FakeLimiter:
+    def __init__(self):
+        self.consumed = []
+
+    def acquire(self, provider, tokens=0):
+        pass
+
+    def consume(self, provider, tokens):
+        self.consumed.append((provider, tokens))
+
+
+@pytest.fixture
+def limiter(monkeypatch):
+    limiter = _FakeLimiter()
+    monkeypatch.setattr("src.ratelimit._limiter", limiter)
+    monkeypatch.setattr(crew, "get_rate_limiter", lambda: limiter)
+    return limiter
+
+
+@pytest.fixture
+def llm(monkeypatch, limiter):
+    monkeypatch.setattr(crew, "LLM", _FakeLLM)
+    return crew.RateLimitedLLM("gemini/gemini-2.0-flash", rate_provider="test")
+
+
+def test_stop_words_are_forwarded_to_inner_llm(llm):
+    # crewai のエージェントと同じように、ラッパーの stop に停止語を設定する
+    llm.stop = list(set(llm.stop + ["\nObservation:"]))
+    llm.call("調査してください")
+
+    assert llm.stop == ["\nObservation:"]
+    assert llm._inner.calls == [["\nObservation:"]]
+
+
+def test_usage_is_taken_from_reported_token_counts(llm, limiter):
+    prompt = "調査してください"
+    estimated = crew.count_tokens(prompt, llm.model)
+    llm.call(prompt)
+    llm.call(prompt)
+
+    assert llm.usage == {"prompt_tokens": 2400, "completion_tokens": 600, "retries": 0}
+    # 枠を取ったときの概算との差分だけを、トークンのバケットで精算する
+    assert limiter.consumed == [("test", 1500 - estimated)] * 2
@@ -0,0 +1,64 @@
+import pytest
+
+import src.competitors as competitors
+from src.competitors import CompetitorIndex
+from src.history import JsonHistoryStore, SQLiteHistoryStore
+
+
+def _rows(name):
+    return [{"name": name, "url": f"https://{name.lower()}.example", "features": "f",
+             "functionality": 7, "usability": 8, "type": "competitor"}]
+
+
+@pytest.fixture
+def competitor_index(tmp_path, monkeypatch):
+    # 空の履歴から作るよう、取り込み済みにしておく
+    monkeypatch.setattr(competitors, "get_history_store", lambda: JsonHistoryStore(str(tmp_path / "empty.json")))
+    index = CompetitorIndex(str(tmp_path / "competitors.db"))
+    monkeypatch.setattr(competitors, "_index", index)
+    return index
+
+
+def _sqlite_store(tmp_path, **limits):
+    return SQLiteHistoryStore(str(tmp_path / "history.db"), legacy_json=None, **limits)
+
+
+def _json_store(tmp_path, **limits):
+    limits.pop("max_bytes", None)
+    return JsonHistoryStore(str(tmp_path / "history.json"), **limits)
+
+
+@pytest.mark.parametrize("make_store", [_sqlite_store, _json_store])
+def test_evicted_topics_are_removed_from_competitor_index(tmp_path, competitor_index, make_store):
+    store = make_store(tmp_path, max_entries=1, max_bytes=0, max_age_days=0)
+    for topic, name in [("アイデアA", "Alpha"), ("アイデアB", "Beta")]:
+        store.put(topic, "レポート", _rows(name))
+        competitor_index.record(topic, _rows(name))
+
+    assert store.get("アイデアA") is None
+    assert [row["name"] for row in competitor_index.top_competitors()] == ["Beta"]
+    assert competitor_index.appearances("url:alpha.example") == []
+
+
+@pytest.mark.parametrize("make_store", [_sqlite_store, _json_store])
+def test_partial_put_keeps_complete_report(tmp_path, make_store):
+    store = make_store(tmp_path, max_entries=0, max_bytes=0, max_age_days=0)
+    store.put("アイデアA", "完了したレポート", _rows("Alpha"))
+    # 再実行が途中で止まっても、前回の完了した結果は上書きしない
+    store.put("  アイデアA\n", "途中のレポート", None, complete=False)
+
+    entry = store.get("アイデアA")
+    assert entry["report"] == "完了したレポート"
+    assert entry["df_data"] == _rows("Alpha")
+    assert entry["complete"] is True
+
+
+@pytest.mark.parametrize("make_store", [_sqlite_store, _json_store])
+def test_complete_put_replaces_partial_report(tmp_path, make_store):
+    store = make_store(tmp_path, max_entries=0, max_bytes=0, max_age_days=0)
+    store.put("アイデアA", "途中のレポート", None, complete=False)
+    assert store.get("アイデアA")["complete"] is False
+
+    store.put("アイデアA", "完了したレポート", _rows("Alpha"))
+    entry = store.get("アイデアA")
+    assert (entry["report"], entry["complete"]) == ("完了したレポート", True)
@@ -0,0 +1,185 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import src.pages as pages
+from src.pages import PageCache, PageFetcher, build_excerpts, is_public_host
+
+_HTML = """<html><head><title>t</title><script>var x = 1;</script></head><body>
+<nav>メニュー メニュー メニュー</nav>
+<article><h1>タスク管理アプリの比較</h1><p>締め切りを守れない人向けのタスク管理アプリです。</p></article>
+<footer>Copyright example.com 2026</footer></body></html>"""
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append((self.path, dict(self.headers)))
+        if self.path == "/page":
+            if self.headers.get("If-None-Match") == '"v1"':
+                self.send_response(304)
+                self.end_headers()
+                return
+            self._send(200, "text/html; charset=utf-8", _HTML.encode("utf-8"), {"ETag": '"v1"'})
+        elif self.path == "/redirect":
+            self.send_response(302)
+            self.send_header("Location", f"http://localhost:{server.server_address[1]}/page")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        elif self.path == "/data.json":
+            self._send(200, "application/json", b'{"a": 1}')
+        elif self.path == "/big":
+            paragraph = "<p>" + "大きなページの本文です。" * 20 + "</p>\n"
+            body = ("<html><body>" + paragraph * 2000 + "</body></html>").encode("utf-8")
+            self._send(200, "text/html; charset=utf-8", body)
+        elif self.path.startswith("/slow/"):
+            with server.lock:
+                server.active += 1
+                server.max_active = max(server.max_active, server.active)
+            time.sleep(0.2)
+            with server.lock:
+                server.active -= 1
+            self._send(200, "text/html; charset=utf-8", _HTML.encode("utf-8"))
+        else:
+            self._send(404, "text/plain", b"not found")
+
+    def _send(self, status, content_type, body, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # 上限まで読んだところでクライアントが切断する
+            pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    httpd.lock = threading.Lock()
+    httpd.requests = []
+    httpd.active = 0
+    httpd.max_active = 0
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _url(server, path):
+    return f"http://127.0.0.1:{server.server_address[1]}{path}"
+
+
+def _fetcher(tmp_path, ttl_hours=24, per_host=2, allow_private=True):
+    # テスト用のサーバーは 127.0.0.1 で動くので、プライベートなアドレスへの接続を許可しておく
+    return PageFetcher(cache=PageCache(str(tmp_path / "pages.db"), ttl_hours=ttl_hours), per_host=per_host,
+                       timeout=5, allow_private=allow_private)
+
+
+def test_fetch_text_extracts_main_text_and_caches(server, tmp_path):
+    fetcher = _fetcher(tmp_path)
+    text = fetcher.fetch_text(_url(server, "/page"))
+    assert "締め切りを守れない人向け" in text
+    assert "メニュー" not in text and "var x" not in text
+
+    # 有効期限内はリクエストせずにキャッシュを返す
+    assert fetcher.fetch_text(_url(server, "/page")) == text
+    assert len(server.requests) == 1
+
+
+def test_fetch_text_revalidates_with_etag(server, tmp_path):
+    fetcher = _fetcher(tmp_path, ttl_hours=0)
+    text = fetcher.fetch_text(_url(server, "/page"))
+    assert fetcher.fetch_text(_url(server, "/page")) == text
+
+    assert len(server.requests) == 2
+    assert server.requests[1][1].get("If-None-Match") == '"v1"'
+
+
+def test_fetch_text_skips_non_html(server, tmp_path):
+    assert _fetcher(tmp_path).fetch_text(_url(server, "/data.json")) == ""
+
+
+def test_fetch_text_stops_at_byte_cap(server, tmp_path, monkeypatch):
+    monkeypatch.setattr(pages, "PAGE_MAX_BYTES", 4096)
+    text = _fetcher(tmp_path).fetch_text(_url(server, "/big"))
+    assert text
+    assert len(text.encode("utf-8")) <= 4096
+
+
+def test_fetch_text_returns_empty_on_error(server, tmp_path):
+    assert _fetcher(tmp_path).fetch_text(_url(server, "/missing")) == ""
+
+
+def test_fetch_many_limits_connections_per_host(server, tmp_path):
+    fetcher = _fetcher(tmp_path, per_host=2)
+    urls = [_url(server, f"/slow/{i}") for i in range(6)]
+    texts = fetcher.fetch_many(urls)
+
+    assert set(texts) == set(urls)
+    assert all("締め切り" in text for text in texts.values())
+    assert server.max_active == 2
+
+
+@pytest.mark.parametrize("host, public", [
+    ("8.8.8.8", True),
+    ("127.0.0.1", False),
+    ("10.0.0.1", False),
+    ("192.168.1.1", False),
+    ("169.254.169.254", False),
+    ("::1", False),
+    ("::ffff:127.0.0.1", False),
+    ("fe80::1", False),
+])
+def test_is_public_host(host, public):
+    assert is_public_host(host) is public
+
+
+def test_fetch_text_refuses_private_address(server, tmp_path):
+    assert _fetcher(tmp_path, allow_private=False).fetch_text(_url(server, "/page")) == ""
+    assert server.requests == []
+
+
+def test_fetch_text_refuses_redirect_to_private_address(server, tmp_path, monkeypatch):
+    # 127.0.0.1 だけを公開アドレスとみなし、リダイレクト先の localhost への接続を拒否させる
+    monkeypatch.setattr(pages, "is_public_host", lambda host: host == "127.0.0.1")
+    assert _fetcher(tmp_path, allow_private=False).fetch_text(_url(server, "/redirect")) == ""
+    assert [path for path, _ in server.requests] == ["/redirect"]
+
+
+def test_build_excerpts_drops_duplicate_paragraphs():
+    results = [
+        {"title": "A", "url": "https://a.example", "snippet": "Aの概要です。"},
+        {"title": "B", "url": "https://b.example", "snippet": "Bの概要です。"},
+    ]
+    texts = {
+        "https://a.example": "Aの概要です。\nAだけの段落です。\n共通のフッターです。",
+        "https://b.example": "共通の フッターです！\nBだけの段落です。",
+    }
+    enriched = build_excerpts(results, texts, per_page=100, total=1000)
+
+    assert enriched[0]["excerpt"] == "Aだけの段落です。\n共通のフッターです。"
+    assert enriched[1]["excerpt"] == "Bだけの段落です。"
+    # 元の検索結果は書き換えない
+    assert "excerpt" not in results[0]
+
+
+def test_build_excerpts_applies_per_page_and_total_caps():
+    results = [{"title": str(i), "url": f"https://{i}.example", "snippet": ""} for i in range(3)]
+    texts = {r["url"]: f"{i}番目のページの本文です。" * 10 for i, r in enumerate(results)}
+    enriched = build_excerpts(results, texts, per_page=50, total=80)
+
+    assert len(enriched[0]["excerpt"]) == 50 + 1  # 末尾の「…」
+    assert len(enriched[1]["excerpt"]) == 30 + 1
+    assert "excerpt" not in enriched[2]
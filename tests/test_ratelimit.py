@@ -0,0 +1,102 @@
+import httpx
+import pytest
+
+import src.ratelimit as ratelimit
+from src.ratelimit import TokenBucketLimiter, guarded_call, is_retryable
+
+
+@pytest.fixture
+def limiter(tmp_path):
+    # テスト中にほとんど補充されないよう、上限を小さくしておく
+    return TokenBucketLimiter(str(tmp_path / "ratelimit.db"), limits={"llm": {"rpm": 3, "tpm": 600},
+                                                                        "search": {"rpm": 3, "tpm": None}})
+
+
+def test_requests_per_minute(limiter):
+    assert [limiter.try_acquire("search") for _ in range(4)] == [True, True, True, False]
+
+
+def test_tokens_per_minute(limiter):
+    assert limiter.try_acquire("llm", tokens=500)
+    assert not limiter.try_acquire("llm", tokens=200)
+    # 取れなかったときは何も引かない
+    assert limiter.try_acquire("llm", tokens=90)
+
+
+def test_consume_settles_actual_usage(limiter):
+    assert limiter.try_acquire("llm", tokens=100)
+    limiter.consume("llm", 450)
+    assert not limiter.try_acquire("llm", tokens=100)
+
+    # 概算より少なかった分は返すが、上限を超えては貯めない
+    limiter.consume("llm", -10 ** 6)
+    assert limiter.try_acquire("llm", tokens=600)
+    assert not limiter.try_acquire("llm", tokens=10)
+
+
+def test_unknown_provider_is_not_limited(limiter):
+    assert all(limiter.try_acquire("other", tokens=10 ** 9) for _ in range(10))
+    limiter.acquire("other")
+
+
+def test_state_is_shared_between_instances(limiter):
+    other = TokenBucketLimiter(limiter.path, limits=limiter.limits)
+    assert limiter.try_acquire("search")
+    assert other.try_acquire("search")
+    assert other.try_acquire("search")
+    assert not limiter.try_acquire("search")
+
+
+class _StatusError(Exception):
+    def __init__(self, message, status_code=None, code=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.code = code
+
+
+class RatelimitException(Exception):
+    """ddgs のレート制限と同じ名前の例外"""
+
+
+@pytest.mark.parametrize("error, retryable", [
+    (_StatusError("Too Many Requests", status_code=429), True),
+    (_StatusError("Service Unavailable", code=503), True),
+    (_StatusError("Bad Request", status_code=400), False),
+    # メッセージに数字や単語が含まれていても、ステータスコードで判定する
+    (_StatusError("invalid value 500 for max_tokens; connection field missing", status_code=400), False),
+    (httpx.ConnectTimeout("timed out"), True),
+    (httpx.ConnectError("connection refused"), True),
+    (httpx.HTTPStatusError("server error", request=httpx.Request("GET", "https://a.example"),
+                           response=httpx.Response(502)), True),
+    (TimeoutError(), True),
+    (ConnectionResetError(), True),
+    (RatelimitException("202 Ratelimit"), True),
+    (ValueError("connection 500 timeout"), False),
+])
+def test_is_retryable(error, retryable):
+    assert is_retryable(error) is retryable
+
+
+def test_guarded_call_retries_retryable_errors(monkeypatch, capsys):
+    monkeypatch.setattr(ratelimit, "RETRY_BASE_DELAY", 0)
+    monkeypatch.setattr(ratelimit, "get_rate_limiter", lambda: TokenBucketLimiter(":memory:", limits={}))
+    calls, retries = [], []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise _StatusError("Too Many Requests", status_code=429)
+        return "ok"
+
+    assert guarded_call("llm", flaky, hedge=False, on_retry=retries.append) == "ok"
+    assert len(calls) == 3 and len(retries) == 2
+    assert capsys.readouterr().out == ""
+
+    def broken():
+        calls.append(1)
+        raise _StatusError("Bad Request", status_code=400)
+
+    calls.clear()
+    with pytest.raises(_StatusError):
+        guarded_call("llm", broken, hedge=False)
+    assert len(calls) == 1
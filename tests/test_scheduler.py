@@ -0,0 +1,104 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from crewai.tasks.task_output import TaskOutput
+from crewai.utilities.constants import NOT_SPECIFIED
+
+import src.scheduler as scheduler
+from src.scheduler import build_dependency_graph, run_tasks_parallel
+from src.task_cache import TaskResultCache
+
+
+class _FakeTask:
+    """execute_sync で受け取ったコンテキストを記録し、delay 秒後に名前を出力する Task"""
+
+    def __init__(self, name, context=NOT_SPECIFIED, delay=0.0):
+        self.name = name
+        self.description = f"{name}: {{topic}}"
+        self.expected_output = name
+        self.context = context
+        self.delay = delay
+        self.agent = SimpleNamespace(role=name, llm=SimpleNamespace(model="fake"), tools=[],
+                                     interpolate_inputs=lambda inputs: None)
+        self.received_context = None
+        self.output = None
+
+    def interpolate_inputs_and_add_conversation_history(self, inputs):
+        self.description = self.description.format(**inputs)
+
+    def execute_sync(self, agent, context, tools):
+        time.sleep(self.delay)
+        self.received_context = context
+        self.output = TaskOutput(description=self.description, expected_output=self.expected_output,
+                                 raw=f"{self.name}の結果", agent=self.name)
+        return self.output
+
+
+@pytest.fixture(autouse=True)
+def task_cache(tmp_path, monkeypatch):
+    cache = TaskResultCache(str(tmp_path / "task_cache.db"))
+    monkeypatch.setattr(scheduler, "get_task_cache", lambda: cache)
+    return cache
+
+
+def test_build_dependency_graph():
+    research = _FakeTask("research", context=[])
+    analysis = _FakeTask("analysis", context=[research])
+    skipped = _FakeTask("skipped", context=[])
+    strategy = _FakeTask("strategy", context=[analysis, skipped])
+    summary = _FakeTask("summary")
+
+    graph = build_dependency_graph([research, analysis, strategy, summary])
+    # 今回実行しないタスクへの依存は無視し、context 未指定なら前の全タスクに依存する
+    assert graph == {0: set(), 1: {0}, 2: {1}, 3: {0, 1, 2}}
+
+
+def test_tasks_output_keeps_task_order_when_finished_out_of_order():
+    slow = _FakeTask("slow", context=[], delay=0.3)
+    fast = _FakeTask("fast", context=[])
+    merge = _FakeTask("merge", context=[slow, fast])
+    finished = []
+
+    result = run_tasks_parallel([slow, fast, merge], {"topic": "アイデア"}, max_workers=2,
+                                on_task_complete=lambda i, output: finished.append(i))
+
+    assert finished == [1, 0, 2]
+    assert [output.raw for output in result.tasks_output] == ["slowの結果", "fastの結果", "mergeの結果"]
+    assert result.raw == "mergeの結果"
+    assert slow.description == "slow: アイデア"
+    assert "slowの結果" in merge.received_context and "fastの結果" in merge.received_context
+
+
+def test_independent_tasks_run_concurrently():
+    started = threading.Barrier(2, timeout=5)
+
+    class _WaitingTask(_FakeTask):
+        def execute_sync(self, agent, context, tools):
+            # 2つのタスクが同時に動いていなければ、Barrier がタイムアウトする
+            started.wait()
+            return super().execute_sync(agent, context, tools)
+
+    tasks = [_WaitingTask("a", context=[]), _WaitingTask("b", context=[])]
+    result = run_tasks_parallel(tasks, {"topic": "アイデア"}, max_workers=2)
+    assert [output.raw for output in result.tasks_output] == ["aの結果", "bの結果"]
+
+
+def test_cached_task_is_not_executed_again():
+    first = _FakeTask("research", context=[])
+    run_tasks_parallel([first], {"topic": "アイデア"})
+
+    second = _FakeTask("research", context=[])
+    result = run_tasks_parallel([second], {"topic": "アイデア"})
+    assert second.received_context is None
+    assert result.raw == "researchの結果"
+
+
+def test_dependency_cycle_raises():
+    a = _FakeTask("a", context=[])
+    b = _FakeTask("b", context=[a])
+    a.context = [b]
+
+    with pytest.raises(ValueError):
+        run_tasks_parallel([a, b], {"topic": "アイデア"})
@@ -0,0 +1,34 @@
+import src.similarity as similarity
+from src.history import normalize_topic
+from src.similarity import topic_document
+from src.utils import build_topic
+
+
+def test_topic_document_keeps_only_user_input():
+    topic = build_topic("タスク管理アプリ", "締め切りが苦手な\nフリーランス", "AIで細分化", "")
+    assert topic_document(normalize_topic(topic)) == "タスク管理アプリ\n締め切りが苦手な\nフリーランス\nAIで細分化"
+
+
+def test_topic_document_keeps_brackets_written_by_the_user():
+    assert topic_document("【新機能】AIコーチ") == "【新機能】AIコーチ"
+
+
+def test_failed_index_is_not_rebuilt_until_retry(monkeypatch):
+    attempts = []
+
+    def broken_index():
+        attempts.append(1)
+        raise OSError("model download failed")
+
+    monkeypatch.setattr(similarity, "SIMILARITY_ENABLED", True)
+    monkeypatch.setattr(similarity, "SimilarTopicIndex", broken_index)
+    monkeypatch.setattr(similarity, "_index", None)
+    monkeypatch.setattr(similarity, "_index_failed_at", None)
+
+    assert similarity.get_similarity_index() is None
+    assert similarity.find_similar_topics("タスク管理アプリ") == []
+    assert len(attempts) == 1
+
+    monkeypatch.setattr(similarity, "SIMILARITY_RETRY_SEC", 0)
+    assert similarity.get_similarity_index() is None
+    assert len(attempts) == 2
@@ -0,0 +1,59 @@
+from types import SimpleNamespace
+
+import pytest
+
+from src.task_cache import TaskResultCache, make_task_key
+from src.templates import format_prefetched_results
+
+
+def _task(description="{topic}の競合を調べる", role="調査担当", model="gemini/gemini-2.0-flash", tools=()):
+    agent = SimpleNamespace(role=role, llm=SimpleNamespace(model=model), tools=list(tools))
+    return SimpleNamespace(agent=agent, description=description, expected_output="競合の一覧")
+
+
+def test_prefetched_results_do_not_change_key():
+    results = [{"title": "A", "url": "https://a.example", "snippet": "Aの概要"}]
+    plain = _task("タスク管理アプリの競合を調べる")
+    prefetched = _task("タスク管理アプリの競合を調べる" + format_prefetched_results(results))
+
+    assert make_task_key(prefetched, []) == make_task_key(plain, [])
+
+
+def test_key_ignores_whitespace_and_width_in_description():
+    assert make_task_key(_task("ＡＩ  コーチの\n\n競合"), []) == make_task_key(_task("AI コーチの\n競合"), [])
+
+
+@pytest.mark.parametrize("changed", [
+    _task(description="別のアイデアの競合を調べる"),
+    _task(role="分析担当"),
+    _task(model="gemini/gemini-2.5-pro"),
+    _task(tools=[SimpleNamespace(name="WebSearch", cache_tag="WebSearch:10:1")]),
+])
+def test_key_changes_with_task_settings(changed):
+    assert make_task_key(changed, []) != make_task_key(_task(), [])
+
+
+def test_key_changes_with_context_outputs_and_budget():
+    task = _task()
+    base = make_task_key(task, [SimpleNamespace(raw="調査結果")])
+
+    assert make_task_key(task, [SimpleNamespace(raw="調査結果")]) == base
+    assert make_task_key(task, [SimpleNamespace(raw="別の調査結果")]) != base
+    assert make_task_key(task, [SimpleNamespace(raw="調査結果")], context_budget=2000) != base
+
+
+def test_cache_returns_stored_output_until_it_expires(tmp_path):
+    cache = TaskResultCache(str(tmp_path / "task_cache.db"), max_entries=2)
+    cache.put("a", "調査担当", "Aの結果")
+    assert cache.get("a") == "Aの結果"
+    assert cache.get("missing") is None
+
+    # 上限を超えたら、最後に使われたのが古いものから消える
+    cache.put("b", "調査担当", "Bの結果")
+    cache.get("a")
+    cache.put("c", "調査担当", "Cの結果")
+    assert cache.get("b") is None
+    assert cache.get("a") == "Aの結果"
+
+    expired = TaskResultCache(str(tmp_path / "task_cache.db"), max_age_days=0)
+    assert expired.get("a") is None
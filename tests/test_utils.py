@@ -0,0 +1,33 @@
+from src.utils import extract_competitor_rows, extract_json_from_text
+
+_ROW = '{"name": "A", "url": "https://a.example", "features": "f", "functionality": 7, "usability": 8, "type": "competitor"}'
+
+
+def test_extract_json_from_code_block():
+    text = f"レポート本文\n```json\n[{_ROW}]\n```\n"
+    assert extract_json_from_text(text)[0]["name"] == "A"
+
+
+def test_extract_json_prefers_outer_table_over_nested_list():
+    row = '{"name": "A", "url": "-", "features": [{"k": "v"}], "functionality": 7, "usability": 8}'
+    data = extract_json_from_text(f"分析結果です。\n[{row}]\n以上です。")
+    assert data[0]["name"] == "A"
+
+    rows = extract_competitor_rows(f"分析結果です。\n[{row}]")
+    assert [r["name"] for r in rows] == ["A"]
+
+
+def test_extract_json_prefers_last_table():
+    first = '[{"name": "下書き", "functionality": 1, "usability": 1}]'
+    text = f"下書き: {first}\n\n最終版:\n[{_ROW}]"
+    assert extract_json_from_text(text)[0]["name"] == "A"
+
+
+def test_extract_json_ignores_citations_and_repairs_broken_json():
+    text = f"出典 [1] を参照。\n[{_ROW},]"
+    assert extract_json_from_text(text)[0]["name"] == "A"
+
+
+def test_extract_json_returns_none_without_table():
+    assert extract_json_from_text("JSONはありません [1]") is None
+    assert extract_competitor_rows("") is None